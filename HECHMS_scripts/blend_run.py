@@ -1,11 +1,12 @@
 from hms.model import Project
 from hms import Hms
+import os
 import csv
 from exceptions import Exception as PythonException
 
 
 
-HMS_CONSTANTS_FILE = '/home/HECHMS_GODAVARI/constants.csv'
+HMS_CONSTANTS_FILE = os.environ.get('HMS_CONSTANTS_FILE','/home/HECHMS_GODAVARI/constants.csv')
 
 constants_file = csv.reader(open(HMS_CONSTANTS_FILE))
 constants_dict = {}
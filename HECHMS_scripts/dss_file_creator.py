@@ -5,7 +5,7 @@ import os
 import csv
 
 col_names = ['Input_folder_name','Input_run_type','Input_dss_name']
-HMS_CONSTANTS_FILE = '/home/HECHMS_GODAVARI/constants.csv'
+HMS_CONSTANTS_FILE = os.environ.get('HMS_CONSTANTS_FILE','/home/HECHMS_GODAVARI/constants.csv')
 
 constants_file = csv.reader(open(HMS_CONSTANTS_FILE))
 constants_dict = {}
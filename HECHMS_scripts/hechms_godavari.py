@@ -5,6 +5,9 @@ import os
 from zipfile import ZipFile
 import shutil
 import xarray as xr
+import scipy.sparse
+import hashlib
+import netCDF4
 import requests
 import calendar
 import time
@@ -12,10 +15,26 @@ import logging
 import csv
 import smtplib
 import subprocess
+import json
+import atexit
+import threading
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from contextlib import contextmanager, ExitStack
 from email.message import EmailMessage
 from os.path import exists as file_exists
 from pydsstools.heclib.dss import HecDss
 from pydsstools.core import TimeSeriesContainer,UNDEFINED
+from hms_files import load_hms_file
+from model_template import template_for_zip, clone_tree, restore_tree, tree_manifest
+from state_archive import StateArchive, saved_state_files
+from rainfall_store import RainfallStore
+from shared_dss import SharedRainfallDss
+from transfer import ScpTransfer, LocalTransfer
+from input_cache import InputCache, InputArchive, open_source
+import pipeline_metrics
 logging.getLogger().setLevel(logging.INFO)
 
 
@@ -23,8 +42,22 @@ FORECAST_RUNS = ['Forecast_ECMWF_ENS','Forecast_ECMWF_DET','Forecast_IMD']
 SC_HEADER_NAMES = ['stn','type','year','month','day','hour','minute','ex_year','ex_month','ex_day','ex_hour','ex_minute','flow_cusecs']
 HEADER_NAMES = ['Stations','Type','Year','Month','Day','Hour','Minute','Flow_in_Cusecs']
 CN_HEADER_NAMES = ['uuid','subbasin_id','cn_type','cn_val']
+GRID_HEADER_NAMES = ['lat','lon','rainfall']
+GRID_DTYPES = {'lat':np.float64,'lon':np.float64,'rainfall':np.float32}
+##same target grid and record naming as the vortex import in dss_file_creator.py
+RAINFALL_TARGET_CELL_SIZE = 5000
+RAINFALL_TARGET_EPSG = 32644
+RAINFALL_WRITE_OPTIONS = {'partA':'UTM44N','partB':'TN_AP','partC':'PRECIPITATION','partF':'GODAVARI','dataType':'PER-CUM','units':'MM'}
 
 HMS_CONSTANTS_FILE = '/home/HECHMS_GODAVARI/constants.csv'
+DEFAULT_WORKSPACE_DIR = '/home/HECHMS_GODAVARI/workspaces/'
+DEFAULT_CACHE_DIR = '/home/HECHMS_GODAVARI/cache/'
+
+##per task copies made in worker pool mode, paths inside MODEL_OUT_DIR are rebased onto the extracted nodes_data.zip
+WORKSPACE_DIR_KEYS = ['MODEL_PATH','FORECAST_FILE_PATH','MODEL_INP_PATH','MODEL_INPUT_DSS_PATH']
+WORKSPACE_OUTPUT_DIR_KEYS = ['OBS_DSS_DIR','DSS_FILE_PATH','NC_FILE_PATH']
+WORKSPACE_FILE_KEYS = ['HMS_PROJ_FILE','GRID_FILE_PATH','GAGE_FILE_PATH','BASIN_FILE_PATH','VIRGIN_BASIN_FILE_PATH','METADATA_INPUT_FILE']
+HMS_PROJECT_EXTENSIONS = ('.hms','.basin','.met','.control','.gage','.grid','.forecast','.run')
 
 run_spec_dict = {'IMD_FORECAST':'IMD','ENSEMBLE_FORECAST':'ECMWF_ENS','ENSEMBLE_DETERMINISTIC':'ECMWF_DET'}
 forecast_spec_dict = {'ENSEMBLE_DETERMINISTIC':'Forecast_ECMWF_DET.forecast','ENSEMBLE_FORECAST':'Forecast_ECMWF_ENS.forecast','IMD_FORECAST':'Forecast_IMD.forecast'}
@@ -44,20 +77,54 @@ SC_OUTPUT_PATH_STRING = 'sc_output_path'
 INPUT_PATH_STRING = 'input_path'
 STATUS_SUCCESS = '1'
 STATUS_FAILURE = '2'
-
+COLUMNAR_SUFFIX = '.parquet'
+OBS_MISSING_VALUE = -3.4028234663852886e+38
+CFS_TO_CMS = 0.028316847
+HMS_SESSION_REPLY_PREFIX = 'HMS_SESSION_REPLY '
+WARM_STATE_PREFIX = 'warm_'
+HEC_EPOCH = np.datetime64('1899-12-31T00:00','m')    ##hec times are minutes since 31Dec1899 0000
+CUSECS_FACTOR = 35.314666212661
+
+
+transfers = {}
+
+def get_transfer(constants_dict):
+    ##one transfer object per process and server, so every scp of the process goes over the same ssh connection
+    backend = constants_dict.get('TRANSFER_BACKEND','scp')
+    options = {'retries':int(constants_dict.get('TRANSFER_RETRIES',3)),'backoff':float(constants_dict.get('TRANSFER_BACKOFF',5)),
+               'verify':constants_dict.get('TRANSFER_VERIFY','true') == 'true'}
+    if backend == 'local':
+        key = (backend,constants_dict.get('TRANSFER_LOCAL_ROOT',''))
+        if key not in transfers:
+            transfers[key] = LocalTransfer(constants_dict.get('TRANSFER_LOCAL_ROOT',''),**options)
+    else:
+        key = (backend,constants_dict['SERVER_IP'],constants_dict['SERVER_SCP'],constants_dict.get('SERVER_SSH','ssh'))
+        if key not in transfers:
+            transfers[key] = ScpTransfer(constants_dict['SERVER_IP'],constants_dict['SERVER_SCP'],constants_dict.get('SERVER_SSH','ssh'),
+                                         control_dir=constants_dict.get('CACHE_DIR',DEFAULT_CACHE_DIR)+'ssh/',**options)
+    return transfers[key]
+
+def cached_input_archive(constants_dict,server_path):
+    ##path of the task input zip in the input cache, downloaded only when that content is not cached yet.
+    ##the server sha256 is the cache key, also with TRANSFER_VERIFY off, so a re-issued or repeated task is found whatever its path
+    ##and a corrected zip at the same path is downloaded again
+    input_cache = InputCache(constants_dict.get('CACHE_DIR',DEFAULT_CACHE_DIR)+'inputs/',int(constants_dict.get('INPUT_CACHE_SIZE_MB',5120))*1024*1024)
+    transfer = get_transfer(constants_dict)
+    sha256 = transfer.checksum(server_path)
+    cached_zip = input_cache.lookup(server_path,sha256)
+    if cached_zip is not None:
+        logging.info('input cache hit :: %s',server_path)
+        return cached_zip
+    return input_cache.store(server_path,download_flow_file(constants_dict,server_path,input_cache.download_dir()))
 
 def download_flow_file(constants_dict,server_path,local_path) :
-    try : 
-        logging.info("Downloading File :: %s",server_path)
-        # downloading file from directory
-        required_file =constants_dict['SERVER_SCP']+" "+constants_dict['SERVER_IP']+":"+server_path+" "+local_path
-        print(required_file)
-        os.system(required_file)
-    
-    except Exception as e:
+    logging.info("Downloading File :: %s",server_path)
+    # downloading file from directory
+    local_file = get_transfer(constants_dict).download(server_path,local_path)
+    if local_file is None:
         # logs input data related errors 
-        logging.info(e)
         raise Exception ("error downloading input data",server_path)
+    return local_file
 
 def send_error_email(error,subject):
     msg = EmailMessage()
@@ -73,8 +140,18 @@ def send_error_email(error,subject):
     server.send_message(msg)
     server.quit()
  
+def model_template(constants_dict):
+    return template_for_zip(constants_dict.get('CACHE_DIR',DEFAULT_CACHE_DIR),constants_dict['BACKUP_FOLDER']+'nodes_data.zip')
+
 def delete_extract_dir(constants_dict):
-    # delete model, model_input, nodes_output folders and extract them again from backup folder after each run or when error occurs
+    # put model, model_input, nodes_output folders back to the backup state after each run or when error occurs
+    # by default only the files changed since the last reset are copied back from the extracted template
+    relative_dir = os.path.relpath(constants_dict['MODEL_OUT_DIR_FILE'],constants_dict['MODEL_OUT_DIR'])
+    if constants_dict.get('MODEL_RESET','template') == 'template' and not relative_dir.startswith('..'):
+        restored = restore_tree(os.path.join(model_template(constants_dict),relative_dir),constants_dict['MODEL_OUT_DIR_FILE'])
+        logging.info('model reset done, %d files restored',restored)
+        return
+
     DELETE_FILES_LIST = [constants_dict['MODEL_OUT_DIR_FILE']]
     for file in DELETE_FILES_LIST:
         shutil.rmtree(file)
@@ -101,33 +178,307 @@ def date_prepare(date_value):
     formatted_date = datetime.date(int(date_value[0:4]),int(date_value[4:6]),int(date_value[6:]))
     return formatted_date
 
-def nc_file_prepare(constants_dict,start_date,end_date,input_grid_data_path,nc_filename):
+def input_source(input_data,name):
+    ##input_data is the extracted task folder or an InputArchive of the cached input zip
+    if isinstance(input_data,InputArchive):
+        return input_data.source(name)
+    return input_data+name
+
+def read_grid_day(grid_day_path):
+    with open_source(grid_day_path) as grid_day_data:
+        grid_day = pd.read_csv(grid_day_data,header=None,names=GRID_HEADER_NAMES,dtype=GRID_DTYPES,engine='c')
+    return grid_day['lat'].values,grid_day['lon'].values,grid_day['rainfall'].values
+
+def iter_grid_days(grid_day_paths,workers):
+    ##reads up to workers daily files ahead of the caller, in date order
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for grid_day_path in grid_day_paths:
+            pending.append(executor.submit(read_grid_day,grid_day_path))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def grid_day_index(grid_lat,grid_lon,lat,lon,index_cache):
+    ##daily files normally list the cells in the same order, so the lat/lon to cell mapping is only worked out again when that changes
+    if index_cache and np.array_equal(index_cache[0],lat) and np.array_equal(index_cache[1],lon):
+        return index_cache[2],index_cache[3]
+    lat_idx = np.searchsorted(grid_lat,lat)
+    lon_idx = np.searchsorted(grid_lon,lon)
+    if (lat_idx >= len(grid_lat)).any() or (lon_idx >= len(grid_lon)).any() \
+            or not np.array_equal(grid_lat[lat_idx],lat) or not np.array_equal(grid_lon[lon_idx],lon):
+        raise ValueError('daily grid does not match the lat/lon axes of the first day')
+    index_cache[:] = [lat,lon,lat_idx,lon_idx]
+    return lat_idx,lon_idx
+
+def load_grid_cube(input_grid_data_path,date_time,workers=4):
+    grid_day_paths = [input_source(input_grid_data_path,tm_.strftime("%Y%m%d")) for tm_ in date_time]
+    grid = None
+    index_cache = []
+    for i,(lat,lon,rainfall) in enumerate(iter_grid_days(grid_day_paths,workers)):
+        if grid is None:
+            grid_lat = np.unique(lat)
+            grid_lon = np.unique(lon)
+            grid = np.full((len(date_time),len(grid_lat),len(grid_lon)),np.nan,dtype=np.float32)
+        lat_idx,lon_idx = grid_day_index(grid_lat,grid_lon,lat,lon,index_cache)
+        grid[i,lat_idx,lon_idx] = rainfall
+    return grid,grid_lat,grid_lon
+
+def rainfall_store_enabled(constants_dict,source):
+    return source is not None and constants_dict.get('RAINFALL_STORE','false') == 'true'
+
+@contextmanager
+def grid_window(constants_dict,input_grid_data_path,date_time,source=None):
+    ##(grid, lat, lon) of the task window, a slice of the shared rainfall store of the source when RAINFALL_STORE is on
+    workers = int(constants_dict.get('GRID_READ_WORKERS',4))
+    if not rainfall_store_enabled(constants_dict,source):
+        yield load_grid_cube(input_grid_data_path,date_time,workers)
+        return
+    store = RainfallStore(constants_dict.get('RAINFALL_STORE_DIR',constants_dict.get('CACHE_DIR',DEFAULT_CACHE_DIR)+'rainfall/'),source,
+                          int(constants_dict.get('RAINFALL_STORE_DAYS',120)))
+    grid_day_paths = [input_source(input_grid_data_path,tm_.strftime("%Y%m%d")) for tm_ in date_time]
+    with store.window([tm_.date() for tm_ in date_time],grid_day_paths,lambda day_paths: iter_grid_days(day_paths,workers)) as window:
+        yield window
+
+def nc_file_stream(nc_path,input_grid_data_path,date_time,workers=4,complevel=4):
+    ##writes one daily slice at a time so memory stays flat however long the window is
+    grid_day_paths = [input_source(input_grid_data_path,tm_.strftime("%Y%m%d")) for tm_ in date_time]
+    index_cache = []
+    with netCDF4.Dataset(nc_path,'w',format='NETCDF4') as OBS:
+        for i,(lat,lon,rainfall) in enumerate(iter_grid_days(grid_day_paths,workers)):
+            if i == 0:
+                grid_lat = np.unique(lat)
+                grid_lon = np.unique(lon)
+                OBS.Conventions = 'CF-1.7'
+                OBS.createDimension('time',None)
+                OBS.createDimension('lat',len(grid_lat))
+                OBS.createDimension('lon',len(grid_lon))
+                time_var = OBS.createVariable('time','i8',('time',))
+                time_var.units = 'days since '+date_time[0].strftime('%Y-%m-%d %H:%M:%S')
+                time_var.calendar = 'proleptic_gregorian'
+                lat_var = OBS.createVariable('lat','f8',('lat',))
+                lat_var.units = 'degrees_north'
+                lat_var[:] = grid_lat
+                lon_var = OBS.createVariable('lon','f8',('lon',))
+                lon_var.units = 'degrees_east'
+                lon_var[:] = grid_lon
+                rainfall_var = OBS.createVariable('rainfall','f4',('time','lat','lon'),zlib=True,shuffle=True,complevel=complevel,
+                                                  chunksizes=(1,len(grid_lat),len(grid_lon)),fill_value=np.float32(np.nan))
+                rainfall_var.units = 'mm'
+                rainfall_var.missing_value = np.float32(-9999)
+                grid_slice = np.empty((len(grid_lat),len(grid_lon)),dtype=np.float32)
+            grid_slice.fill(np.nan)
+            lat_idx,lon_idx = grid_day_index(grid_lat,grid_lon,lat,lon,index_cache)
+            grid_slice[lat_idx,lon_idx] = rainfall
+            rainfall_var[i,:,:] = grid_slice
+            time_var[i] = (date_time[i]-date_time[0]).days
+
+def nc_file_prepare(constants_dict,start_date,end_date,input_grid_data_path,nc_filename,source=None):
     start_date_string = start_date[0:4]+'-'+start_date[4:6]+'-'+start_date[6:]
     # start_date_string = '2022-05-02'
     end_date_string = end_date[0:4]+'-'+end_date[4:6]+'-'+end_date[6:]
     date_time=pd.date_range(start=start_date_string,end=end_date_string, freq='D')
 
-    csv_daily=pd.read_csv(input_grid_data_path+start_date,header=None)
-    csv_daily.columns = ['lat','lon','rainfall']
-    grid_lon=np.array(sorted(set(csv_daily['lon'])))
-    grid_lat=np.array(sorted(set(csv_daily['lat'])))
-    grid=np.zeros((len(date_time),len(grid_lat),len(grid_lon)),dtype=float)*np.nan
-
-    for i,tm_ in enumerate(date_time):
-        Date=tm_.strftime("%Y%m%d")
-        # print(Date,i)
-        csv_daily=pd.read_csv(input_grid_data_path+Date,header=None)
-        csv_daily.columns = ['lat','lon','rainfall']
-        grid[i,:,:]=csv_daily.pivot( 'lat','lon', 'rainfall').values   
-
-    OBS = xr.Dataset({'rainfall': (['time','lat','lon'], grid,{'units':'mm'})},
-                    coords={'lon': (['lon'], grid_lon,{'units':'degrees_east'}),
-                            'lat': (['lat'], grid_lat,{'units':'degrees_north'}),
-                            'time': date_time})
-    OBS.attrs['Conventions'] = 'CF-1.7'
-    OBS.rainfall.attrs['missing_value'] = -9999
-    xr.decode_cf(OBS)
-    OBS.to_netcdf(constants_dict['NC_FILE_PATH']+nc_filename+'.nc',format = 'NETCDF4')
+    if constants_dict.get('NC_STREAMING','false') == 'true' and not rainfall_store_enabled(constants_dict,source):
+        nc_file_stream(constants_dict['NC_FILE_PATH']+nc_filename+'.nc',input_grid_data_path,date_time,
+                       int(constants_dict.get('GRID_READ_WORKERS',4)),int(constants_dict.get('NC_COMPRESSION_LEVEL',4)))
+        return
+
+    with grid_window(constants_dict,input_grid_data_path,date_time,source) as (grid,grid_lat,grid_lon):
+        OBS = xr.Dataset({'rainfall': (['time','lat','lon'], grid,{'units':'mm'})},
+                        coords={'lon': (['lon'], grid_lon,{'units':'degrees_east'}),
+                                'lat': (['lat'], grid_lat,{'units':'degrees_north'}),
+                                'time': date_time})
+        OBS.attrs['Conventions'] = 'CF-1.7'
+        OBS.rainfall.attrs['missing_value'] = -9999
+        xr.decode_cf(OBS)
+        OBS.to_netcdf(constants_dict['NC_FILE_PATH']+nc_filename+'.nc',format = 'NETCDF4')
+
+def source_axis_position(grid_axis,points):
+    ##fractional index of points along a cell centre axis, points up to half a cell outside the axis take the edge cell and further out are nan
+    half_first = (grid_axis[1]-grid_axis[0])/2 if len(grid_axis) > 1 else 0.5
+    half_last = (grid_axis[-1]-grid_axis[-2])/2 if len(grid_axis) > 1 else 0.5
+    axis_points = np.concatenate(([grid_axis[0]-half_first],grid_axis,[grid_axis[-1]+half_last]))
+    axis_index = np.concatenate(([0],np.arange(len(grid_axis)),[len(grid_axis)-1])).astype(float)
+    return np.interp(points,axis_points,axis_index,left=np.nan,right=np.nan)
+
+def utm_target_grid(grid_lat,grid_lon,cell_size,epsg):
+    from pyproj import Transformer
+    to_target = Transformer.from_crs('EPSG:4326','EPSG:'+str(epsg),always_xy=True)
+    half_lat = (grid_lat[-1]-grid_lat[0])/max(len(grid_lat)-1,1)/2
+    half_lon = (grid_lon[-1]-grid_lon[0])/max(len(grid_lon)-1,1)/2
+    edge_lat = np.linspace(grid_lat[0]-half_lat,grid_lat[-1]+half_lat,50)
+    edge_lon = np.linspace(grid_lon[0]-half_lon,grid_lon[-1]+half_lon,50)
+    boundary_lon = np.concatenate((edge_lon,edge_lon,np.full(50,edge_lon[0]),np.full(50,edge_lon[-1])))
+    boundary_lat = np.concatenate((np.full(50,edge_lat[0]),np.full(50,edge_lat[-1]),edge_lat,edge_lat))
+    x,y = to_target.transform(boundary_lon,boundary_lat)
+    ##snapped to whole cells like the vortex target grid
+    xmin = np.floor(np.min(x)/cell_size)*cell_size
+    xmax = np.ceil(np.max(x)/cell_size)*cell_size
+    ymin = np.floor(np.min(y)/cell_size)*cell_size
+    ymax = np.ceil(np.max(y)/cell_size)*cell_size
+    shape = (int(round((ymax-ymin)/cell_size)),int(round((xmax-xmin)/cell_size)))
+    return xmin,ymax,shape
+
+def bilinear_regrid(grid_lat,grid_lon,cell_size=RAINFALL_TARGET_CELL_SIZE,epsg=RAINFALL_TARGET_EPSG):
+    ##sparse (target cells x source cells) matrix of bilinear weights, target rows run north to south
+    from pyproj import Transformer
+    xmin,ymax,shape = utm_target_grid(grid_lat,grid_lon,cell_size,epsg)
+    x = xmin + (np.arange(shape[1])+0.5)*cell_size
+    y = ymax - (np.arange(shape[0])+0.5)*cell_size
+    target_x,target_y = np.meshgrid(x,y)
+    to_source = Transformer.from_crs('EPSG:'+str(epsg),'EPSG:4326',always_xy=True)
+    lon,lat = to_source.transform(target_x.ravel(),target_y.ravel())
+    lat_pos = source_axis_position(grid_lat,lat)
+    lon_pos = source_axis_position(grid_lon,lon)
+    inside = ~(np.isnan(lat_pos) | np.isnan(lon_pos))
+    lat_pos = lat_pos[inside]
+    lon_pos = lon_pos[inside]
+    lat0 = np.floor(lat_pos).astype(int)
+    lon0 = np.floor(lon_pos).astype(int)
+    lat1 = np.minimum(lat0+1,len(grid_lat)-1)
+    lon1 = np.minimum(lon0+1,len(grid_lon)-1)
+    lat_frac = lat_pos-lat0
+    lon_frac = lon_pos-lon0
+    rows = np.tile(np.flatnonzero(inside),4)
+    cols = np.concatenate((lat0*len(grid_lon)+lon0,lat0*len(grid_lon)+lon1,lat1*len(grid_lon)+lon0,lat1*len(grid_lon)+lon1))
+    weights = np.concatenate(((1-lat_frac)*(1-lon_frac),(1-lat_frac)*lon_frac,lat_frac*(1-lon_frac),lat_frac*lon_frac))
+    keep = weights > 0
+    matrix = scipy.sparse.csr_matrix((weights[keep],(rows[keep],cols[keep])),shape=(inside.size,len(grid_lat)*len(grid_lon)))
+    return {'matrix':matrix,'inside':inside,'shape':shape,'xmin':xmin,'ymax':ymax,'cell_size':cell_size,'epsg':epsg}
+
+regrid_cache = {}
+
+def cached_regrid(constants_dict,grid_lat,grid_lon):
+    ##weights depend only on the source axes and the target grid, so they are kept on disk under a hash of both
+    cell_size = int(constants_dict.get('RAINFALL_TARGET_CELL_SIZE',RAINFALL_TARGET_CELL_SIZE))
+    epsg = int(constants_dict.get('RAINFALL_TARGET_EPSG',RAINFALL_TARGET_EPSG))
+    key_hash = hashlib.sha1()
+    for part in [np.ascontiguousarray(grid_lat,dtype=np.float64).tobytes(),np.ascontiguousarray(grid_lon,dtype=np.float64).tobytes(),
+                 str(cell_size).encode(),str(epsg).encode(),b'bilinear']:
+        key_hash.update(part)
+    key = key_hash.hexdigest()
+    if key in regrid_cache:
+        return regrid_cache[key]
+
+    cache_dir = constants_dict.get('CACHE_DIR',DEFAULT_CACHE_DIR)
+    cache_path = cache_dir+'regrid_'+key+'.npz'
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            matrix = scipy.sparse.csr_matrix((cached['data'],cached['indices'],cached['indptr']),shape=tuple(cached['matrix_shape']))
+            regrid = {'matrix':matrix,'inside':cached['inside'],'shape':tuple(int(i) for i in cached['shape']),
+                      'xmin':float(cached['xmin']),'ymax':float(cached['ymax']),'cell_size':cell_size,'epsg':epsg}
+    else:
+        logging.info('building regrid weights :: %s',cache_path)
+        regrid = bilinear_regrid(grid_lat,grid_lon,cell_size,epsg)
+        os.makedirs(cache_dir,exist_ok=True)
+        temp_path = cache_path+'.'+str(os.getpid())+'.tmp.npz'
+        np.savez(temp_path,data=regrid['matrix'].data,indices=regrid['matrix'].indices,indptr=regrid['matrix'].indptr,
+                 matrix_shape=np.array(regrid['matrix'].shape),inside=regrid['inside'],shape=np.array(regrid['shape']),
+                 xmin=regrid['xmin'],ymax=regrid['ymax'])
+        os.replace(temp_path,cache_path)
+    regrid_cache[key] = regrid
+    return regrid
+
+def regrid_slice(regrid,grid_slice):
+    target = regrid['matrix'].dot(grid_slice.ravel().astype(np.float64))
+    target[~regrid['inside']] = np.nan
+    return target.reshape(regrid['shape']).astype(np.float32)
+
+def rainfall_record_pathname(date_value):
+    ##each daily grid covers the 24 hours centred on its timestamp, the same records vortex writes and grid_file points at
+    record_start = (date_value - pd.Timedelta(hours=12)).strftime('%d%b%Y:%H%M').upper()
+    record_end = (date_value + pd.Timedelta(hours=12)).strftime('%d%b%Y:%H%M').upper()
+    return '/'+'/'.join([RAINFALL_WRITE_OPTIONS['partA'],RAINFALL_WRITE_OPTIONS['partB'],RAINFALL_WRITE_OPTIONS['partC'],
+                         record_start,record_end,RAINFALL_WRITE_OPTIONS['partF']])+'/'
+
+def rainfall_grid_info(regrid):
+    from pydsstools.heclib.utils import gridInfo
+    from pyproj import CRS
+    from affine import Affine
+    grid_info = gridInfo()
+    grid_info.update([('grid_type','specified-time'),
+                      ('grid_crs',CRS.from_epsg(regrid['epsg']).to_wkt()),
+                      ('grid_transform',Affine(regrid['cell_size'],0,regrid['xmin'],0,-regrid['cell_size'],regrid['ymax'])),
+                      ('data_type',RAINFALL_WRITE_OPTIONS['dataType'].lower()),
+                      ('data_units',RAINFALL_WRITE_OPTIONS['units']),
+                      ('opt_crs_name',RAINFALL_WRITE_OPTIONS['partA']),
+                      ('opt_time_stamped',False)])
+    return grid_info
+
+def write_rainfall_dss(constants_dict,destination,grid,grid_lat,grid_lon,date_time):
+    regrid = cached_regrid(constants_dict,grid_lat,grid_lon)
+    grid_info = rainfall_grid_info(regrid)
+    dss_file = HecDss.Open(destination)
+    try:
+        for i,tm_ in enumerate(date_time):
+            dss_file.put_grid(rainfall_record_pathname(tm_),regrid_slice(regrid,grid[i]),grid_info)
+    finally:
+        dss_file.close()
+
+def rainfall_dss_reuse(constants_dict,source):
+    return source is not None and constants_dict.get('RAINFALL_DSS_REUSE','false') == 'true'
+
+def write_rainfall_records(constants_dict,destination,grid,grid_lat,grid_lon,date_time):
+    ##regridded daily records of the task window with their content hashes, written into the shared dss of the source at compute time
+    regrid = cached_regrid(constants_dict,grid_lat,grid_lon)
+    records = np.stack([regrid_slice(regrid,grid[i]) for i in range(len(date_time))])
+    np.savez(destination,records=records,pathnames=np.array([rainfall_record_pathname(tm_) for tm_ in date_time]),
+             sha256=np.array([hashlib.sha256(record.tobytes()).hexdigest() for record in records]),grid_lat=grid_lat,grid_lon=grid_lon)
+
+@contextmanager
+def shared_rainfall_dss(constants_dict,source,dss_file_name,records_path):
+    ##shared rainfall dss of the source with the records of this task written, held for reading until the block ends
+    with np.load(records_path) as saved:
+        records = saved['records']
+        pathnames = [str(pathname) for pathname in saved['pathnames']]
+        hashes = [str(sha256) for sha256 in saved['sha256']]
+        grid_lat = saved['grid_lat']
+        grid_lon = saved['grid_lon']
+    shared_dss = SharedRainfallDss(constants_dict.get('RAINFALL_DSS_DIR',constants_dict.get('CACHE_DIR',DEFAULT_CACHE_DIR)+'rainfall_dss/'),source,dss_file_name,
+                                   int(constants_dict.get('RAINFALL_DSS_DAYS',120)))
+
+    def write_records(changed):
+        grid_info = rainfall_grid_info(cached_regrid(constants_dict,grid_lat,grid_lon))
+        positions = {pathname:i for i,pathname in enumerate(pathnames)}
+        dss_file = HecDss.Open(shared_dss.dss_path)
+        try:
+            for pathname in changed:
+                dss_file.put_grid(pathname,records[positions[pathname]],grid_info)
+        finally:
+            dss_file.close()
+
+    with shared_dss.reading(dict(zip(pathnames,hashes)),write_records) as dss_path:
+        logging.info('shared rainfall dss %s, %d of %d records written',dss_path,len(shared_dss.changed),len(pathnames))
+        yield dss_path
+
+def point_grid_dss(grid_file_path,rainfall_dss_path):
+    ##grids reading a dss of the same file name as rainfall_dss_path read rainfall_dss_path instead
+    def repointed(grid_dss_name):
+        if os.path.basename(grid_dss_name.replace('\\','/')) == os.path.basename(rainfall_dss_path):
+            return rainfall_dss_path
+        return grid_dss_name
+
+    grid_hms_file = load_hms_file(grid_file_path)
+    grid_hms_file.update_field('Grid',None,'DSS File Name',repointed)    ##each variant line on its own
+    grid_hms_file.save()
+
+def rainfall_dss_prepare(constants_dict,start_date,end_date,input_grid_data_path,input_folder,input_dss_name,source=None):
+    ##in process replacement for nc_file_prepare plus dss_file_creator.py, no netcdf file and no jvm launch
+    start_date_string = start_date[0:4]+'-'+start_date[4:6]+'-'+start_date[6:]
+    end_date_string = end_date[0:4]+'-'+end_date[4:6]+'-'+end_date[6:]
+    date_time=pd.date_range(start=start_date_string,end=end_date_string, freq='D')
+
+    destination_dir = constants_dict['DSS_FILE_PATH']+input_folder+'/'
+    if os.path.exists(destination_dir):
+        shutil.rmtree(destination_dir)
+    os.mkdir(destination_dir)
+    with grid_window(constants_dict,input_grid_data_path,date_time,source) as (grid,grid_lat,grid_lon):
+        if rainfall_dss_reuse(constants_dict,source):
+            write_rainfall_records(constants_dict,destination_dir+input_dss_name+'.npz',grid,grid_lat,grid_lon,date_time)
+        else:
+            write_rainfall_dss(constants_dict,destination_dir+input_dss_name+'.dss',grid,grid_lat,grid_lon,date_time)
 
 def creating_metadatafile(INPUT_FOLDER_NAME,dss_file_type,dss_file_name,constants_dict):
     METADATA_INPUT_FILE = constants_dict['METADATA_INPUT_FILE']
@@ -140,30 +491,57 @@ def creating_metadatafile(INPUT_FOLDER_NAME,dss_file_type,dss_file_name,constant
     writer.writerow(rowList)
     metadata_file.close()
 
+def station_list(constants_dict):
+    ##STATIONS_DATA kept as a .npy copy in CACHE_DIR, read_excel only runs again when the excel file changes
+    stations_path = constants_dict['STATIONS_DATA']
+    cache_dir = constants_dict.get('CACHE_DIR',DEFAULT_CACHE_DIR)
+    cache_prefix = 'stations_'+hashlib.sha1(stations_path.encode()).hexdigest()[:12]+'_'
+    cache_path = cache_dir+cache_prefix+str(os.stat(stations_path).st_mtime_ns)+'.npy'
+    if os.path.exists(cache_path):
+        return np.load(cache_path,allow_pickle=False).tolist()
+
+    stns = pd.read_excel(stations_path,header = 0, index_col= None)
+    NODES_DATA = stns['stn'].astype(str).to_list()
+    os.makedirs(cache_dir,exist_ok=True)
+    for name in os.listdir(cache_dir):
+        if name.startswith(cache_prefix):
+            os.remove(cache_dir+name)
+    temp_path = cache_path+'.'+str(os.getpid())+'.tmp.npy'
+    np.save(temp_path,np.array(NODES_DATA,dtype=str))
+    os.replace(temp_path,cache_path)
+    return NODES_DATA
+
 def realtime_data_parse(constants_dict,obs_file):
-    
-    realtime_data_file = pd.read_csv(constants_dict['OBS_FLOWS_DIR']+obs_file,header=None,index_col=False,names =HEADER_NAMES)
-    
-    inflows = realtime_data_file.loc[realtime_data_file['Type']=='Inflow'].drop('Type',axis=1)
-    outflows = realtime_data_file.loc[realtime_data_file['Type']=='Outflow'].drop('Type',axis=1)
-    
-    status_flag = False
-    flag = False
-
-    stns = pd.read_excel(constants_dict['STATIONS_DATA'],header = 0, index_col= None)
-    NODES_DATA = stns['stn'].to_list()
-
-    for i in range(len(NODES_DATA)) :
-        inflows_df = inflows.loc[inflows['Stations']==NODES_DATA[i]]
-        outflows_df = outflows.loc[outflows['Stations']==NODES_DATA[i]]
-        status_flag = status_flag or (inflows_df['Flow_in_Cusecs']<0).any().any()
-        # print('inf',status_flag)
-        status_flag = status_flag or (outflows_df['Flow_in_Cusecs']<0).any().any()
-        # print('out',status_flag)
-        inflows_df.to_csv(constants_dict['MODEL_INP_PATH']+NODES_DATA[i]+REALTIME_INFLOWS_INP_FILE, index=False,header=False)
-        outflows_df.to_csv(constants_dict['MODEL_INP_PATH']+NODES_DATA[i]+REALTIME_OUTFLOWS_INP_FILE, index=False,header=False)
-    
-    return flag
+    ##obs_file is a file in OBS_FLOWS_DIR or a member of the cached input zip
+    obs_source = obs_file if isinstance(obs_file,tuple) else constants_dict['OBS_FLOWS_DIR']+obs_file
+    with open_source(obs_source) as obs_data:
+        realtime_data_file = pd.read_csv(obs_data,header=None,index_col=False,names =HEADER_NAMES)
+    NODES_DATA = station_list(constants_dict)
+
+    ##negative flows mark missing observations
+    station_rows = realtime_data_file['Stations'].astype(str).isin(NODES_DATA) & realtime_data_file['Type'].isin(['Inflow','Outflow'])
+    status_flag = bool((realtime_data_file.loc[station_rows,'Flow_in_Cusecs'] < 0).any())
+
+    ##one pass over the observed data, stations without rows still get empty files
+    empty_df = realtime_data_file.iloc[0:0].drop('Type',axis=1)
+    groups = {key:group.drop('Type',axis=1) for key,group in realtime_data_file.groupby([realtime_data_file['Stations'].astype(str),'Type'],sort=False)}
+
+    jobs = []
+    for stn in NODES_DATA:
+        jobs.append((groups.get((stn,'Inflow'),empty_df),constants_dict['MODEL_INP_PATH']+stn+REALTIME_INFLOWS_INP_FILE))
+        jobs.append((groups.get((stn,'Outflow'),empty_df),constants_dict['MODEL_INP_PATH']+stn+REALTIME_OUTFLOWS_INP_FILE))
+    with ThreadPoolExecutor(max_workers=int(constants_dict.get('OBS_WRITE_WORKERS',8))) as executor:
+        for written in executor.map(lambda job: job[0].to_csv(job[1],index=False,header=False),jobs):
+            pass
+
+    return status_flag
+
+def read_observed_flows(csv_path):
+    ##flow is the last column, negative flows are missing values
+    if os.path.getsize(csv_path) == 0:
+        return np.array([],dtype=np.float64)
+    flows = pd.read_csv(csv_path,header=None,index_col=False).iloc[:,-1].to_numpy(dtype=np.float64)
+    return np.where(flows < 0,OBS_MISSING_VALUE,flows*CFS_TO_CMS)
 
 def observed_flows_data_prep(constants_dict):
     
@@ -185,30 +563,39 @@ def observed_flows_data_prep(constants_dict):
     with open(INPUT_CSV_PATH) as metadata_file:
         metadata = csv.reader(metadata_file)
         headers = next(metadata)
-        for row in metadata:
-            print(row)
-            stn_name = str(row[1])
-            with open(NODES_DATA_PATH+ row[0] +'/'+ row[4]) as csv_file:
-                data = csv.reader(csv_file)
-                dss_arr = []
-                for row in data:
-                    if float(row[-1]) < 0:
-                        # print(row[0])
-                        dss_arr.append(float(-3.4028234663852886e+38))
-                    else:
-                        dss_arr.append(float(row[-1])*0.028316847)
-                # startTime = start_date+' '+start_time
-                tsc = TimeSeriesContainer()
-                tsc.pathname = '/GODAVARI/OBSERVED/FLOW//1DAY/OBSERVED/'
-                tsc.interval = 1
-                tsc.values = dss_arr
-                tsc.startDateTime = start_date +" "+ start_time
-                tsc.numberValues = len(dss_arr)
-                tsc.units = 'M3/S'
-                tsc.type = 'PER-AVER'
-                dssFile = HecDss.Open(OBSERVED_DISCHARGE_PATH + stn_name +'.dss')
-                dssFile.put(tsc)
-                dssFile.close()
+        rows = list(metadata)
+
+    station_files = {}
+    for row in rows:
+        station_files.setdefault(OBSERVED_DISCHARGE_PATH + str(row[1]) +'.dss',[]).append(NODES_DATA_PATH+ row[0] +'/'+ row[4])
+
+    ##heclib is not thread safe, station dss files are written in parallel from separate processes, one file per call
+    workers = min(int(constants_dict.get('OBS_WRITE_WORKERS',8)),len(station_files))
+    if workers <= 1:
+        for dss_path,csv_paths in station_files.items():
+            write_observed_dss(dss_path,csv_paths,start_date +" "+ start_time)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for written in executor.map(write_observed_dss,list(station_files.keys()),list(station_files.values()),[start_date +" "+ start_time]*len(station_files)):
+            pass
+
+def write_observed_dss(dss_path,csv_paths,start_date_time):
+    ##every station file of one dss is written with a single handle, closed before the next dss is opened
+    dssFile = HecDss.Open(dss_path)
+    try:
+        for csv_path in csv_paths:
+            dss_arr = read_observed_flows(csv_path)
+            tsc = TimeSeriesContainer()
+            tsc.pathname = '/GODAVARI/OBSERVED/FLOW//1DAY/OBSERVED/'
+            tsc.interval = 1
+            tsc.values = dss_arr
+            tsc.startDateTime = start_date_time
+            tsc.numberValues = len(dss_arr)
+            tsc.units = 'M3/S'
+            tsc.type = 'PER-AVER'
+            dssFile.put(tsc)
+    finally:
+        dssFile.close()
 
 def get_file_fromstatus(status_flag,run_type):
     if status_flag == False:
@@ -235,49 +622,47 @@ def forecast_file(constants_dict,file,start_date,forecast_date,end_date):
     forecast_date_string = forecast_file_date_parsing(forecast_date)
     end_date_string = forecast_file_date_parsing(end_date)
 
-
-    with open(constants_dict['FORECAST_FILE_PATH'] + file,'r') as forecast_file:
-        forecast_file_data = forecast_file.read()
-
-    word_1 = 'Start Date'
-    word_2 = 'Forecast Date'
-    word_3 = 'End Date'
-    sentences = forecast_file_data.split('\n')
-
-    for sentence in sentences:
-        if word_1 in sentence:
-            a = sentences.index(sentence)
-        elif word_2 in sentence:
-            b = sentences.index(sentence)
-        elif word_3 in sentence:
-            c = sentences.index(sentence)
-
-    startdate_string = sentences[a].split(':')
-    startdate_string[1] = ' '+ start_date_string                              #'02 August 2020'
-    # startdate_string[1] = ' '+ '01 December 2021'
-    startdate_string = ':'.join(startdate_string)
-    sentences[a] = startdate_string
-
-    forecastdate_string = sentences[b].split(':')
-    forecastdate_string[1] = ' '+ forecast_date_string                              #'02 August 2020'
-    forecastdate_string = ':'.join(forecastdate_string)
-    sentences[b] = forecastdate_string
-
-    enddate_string = sentences[c].split(':')
-    enddate_string[1] = ' '+ end_date_string                                  #'03 August 2020'
-    enddate_string = ':'.join(enddate_string)
-    sentences[c] = enddate_string
-
-    open(constants_dict['FORECAST_FILE_PATH'] + file,"w").close()
-
-    forecast_file_write = open(constants_dict['FORECAST_FILE_PATH'] + file,"w+")
-
-    # print(sentences)
-
-    for i in sentences:
-        forecast_file_write.write(i)
-        forecast_file_write.write('\n')
-    forecast_file_write.close()
+    forecast_hms_file = load_hms_file(constants_dict['FORECAST_FILE_PATH'] + file)
+    kind,name = next(iter(forecast_hms_file.blocks))    ##only the Forecast: block, element blocks keep their own dates
+    forecast_hms_file.set_field(kind,name,'Start Date',start_date_string,last_only=True)                #'02 August 2020'
+    # forecast_hms_file.set_field(kind,name,'Start Date','01 December 2021',last_only=True)
+    forecast_hms_file.set_field(kind,name,'Forecast Date',forecast_date_string,last_only=True)          #'02 August 2020'
+    forecast_hms_file.set_field(kind,name,'End Date',end_date_string,last_only=True)                    #'03 August 2020'
+    forecast_hms_file.save()
+
+def state_archive(constants_dict):
+    return StateArchive(constants_dict.get('STATE_ARCHIVE_DIR',constants_dict.get('CACHE_DIR',DEFAULT_CACHE_DIR)+'states/'),
+                        int(constants_dict.get('STATE_ARCHIVE_DAYS',30)))
+
+def warm_start(constants_dict,runtype,file,start_date,forecast_date):
+    ##restores the newest saved state inside the task window and returns the simulation start date with the model snapshot
+    ##taken before the compute, the state saved at forecast_date is picked out of that snapshot afterwards
+    archive = state_archive(constants_dict)
+    state_date = archive.nearest(runtype,start_date,forecast_date)
+    forecast_hms_file = load_hms_file(constants_dict['FORECAST_FILE_PATH'] + file)
+    kind,name = next(iter(forecast_hms_file.blocks))    ##first block of the file, Forecast: for forecast specs
+    state_time = forecast_hms_file.get_field(kind,name,'Forecast Time') or '00:00'
+    if state_date is not None:
+        restored = archive.restore(runtype,state_date,constants_dict['MODEL_PATH'])
+        forecast_hms_file.put_field(kind,name,'Start State Name',WARM_STATE_PREFIX+state_date.strftime('%Y%m%d'))
+        forecast_hms_file.put_field(kind,name,'Start Time',state_time)
+        logging.info('warm start from %s state, %d files restored',state_date,len(restored))
+    else:
+        forecast_hms_file.remove_field(kind,name,'Start State Name')
+        logging.info('no saved state between %s and %s, cold start',start_date,forecast_date)
+    forecast_hms_file.put_field(kind,name,'Save State Name',WARM_STATE_PREFIX+forecast_date.strftime('%Y%m%d'))
+    forecast_hms_file.put_field(kind,name,'Save State Date',forecast_file_date_parsing(forecast_date))
+    forecast_hms_file.put_field(kind,name,'Save State Time',state_time)
+    forecast_hms_file.save()
+    return (state_date or start_date),tree_manifest(constants_dict['MODEL_PATH'])[0]
+
+def save_warm_state(constants_dict,runtype,forecast_date,model_snapshot):
+    state_name = WARM_STATE_PREFIX+forecast_date.strftime('%Y%m%d')
+    state_files = saved_state_files(model_snapshot,tree_manifest(constants_dict['MODEL_PATH'])[0],state_name)
+    if not state_files:
+        raise Exception('hms wrote no state files named '+state_name)
+    state_dir = state_archive(constants_dict).save(runtype,forecast_date,constants_dict['MODEL_PATH'],state_files)
+    logging.info('state %s saved to %s :: %s',state_name,state_dir,','.join(state_files))
 
 def grid_file_date_parsing(date_value,index):
     if index == 0:
@@ -298,35 +683,19 @@ def grid_file(constants_dict,start_date,end_date):
     print("inside grid file parsing")
     start_date_string = grid_file_date_parsing(start_date,0)
     end_date_string = grid_file_date_parsing(start_date,1)
-    with open(constants_dict['GRID_FILE_PATH'],'r') as grid_file:
-        grid_file_data = grid_file.read()
+    grid_hms_file = load_hms_file(constants_dict['GRID_FILE_PATH'])
 
-    word = 'DSS Pathname'
-    sentences = grid_file_data.split('\n')
-
-    idx = []
-    for i in range(len(sentences)):
-        if word in sentences[i]:
-            idx.append(i)
-
-    for j in idx:
-        dss_string = sentences[j].split('/')
+    def dated_pathname(dss_pathname):
+        dss_string = dss_pathname.split('/')
         dss_string[4] = start_date_string                        #'02JAN2020:1200'
         # dss_string[4] = '01MAY2022:1200'
         # dss_string[5] = '02MAY2022:1200'
         dss_string[5] = end_date_string                          #'03JAN2020:1200'
-        dss_string = '/'.join(dss_string)
-
-        sentences[j] = dss_string
+        return '/'.join(dss_string)
 
-    open(constants_dict['GRID_FILE_PATH'],"w").close()
-
-    grid_file_write = open(constants_dict['GRID_FILE_PATH'],"w+")
-
-    for i in sentences:
-        grid_file_write.write(i)
-        grid_file_write.write('\n')
-    grid_file_write.close()
+    ##every DSS Pathname line keeps its own record, only the dates change
+    grid_hms_file.update_field(None,None,'DSS Pathname',dated_pathname)
+    grid_hms_file.save()
 
 def basin_file(constants_dict,CN_PATH,BASIN_PATH):
     # cn_data = pd.read_csv(CN_PATH,header=None,index_col=False,names =CN_HEADER_NAMES)
@@ -336,43 +705,28 @@ def basin_file(constants_dict,CN_PATH,BASIN_PATH):
     subbasin_ids = cn_data['Name'].to_list()
     cn_vals = cn_data['CN3'].to_list()
     # print(subbasin_ids,cn_vals)
-
-    with open(BASIN_PATH,'r') as basin_file:
-            basin_file_data = basin_file.read()
-    sentences = basin_file_data.split('\n')
-
-    idx1 = []
-    idx2 = []
-    start = []
-    end = []
-    for idx in range(len(subbasin_ids)):
-        word_1 = 'Subbasin: '+str(subbasin_ids[idx])
-        for i in range(len(sentences)):
-            if word_1 in sentences[i]:
-                idx1.append(i)
-
-    for i in idx1:
-        clip_sentence = sentences[i:]
-        word_2 = 'End:'
-        for j in range(len(clip_sentence)):
-            if word_2 in clip_sentence[j]:
-                idx2.append(i+j)
-                break
-
-    for x in range(len(idx1)):
-        clip_sentences = sentences[idx1[x]:idx2[x]+1]
-        clip_sentences[-12] = '     Curve Number: '+str(cn_vals[x])
-        for y in range(len(clip_sentences)):
-            sentences[idx1[x]+y] = clip_sentences[y]
-
-    open(BASIN_PATH,"w").close()
-
-    basin_file_write = open(BASIN_PATH,"w+")
-
-    for i in sentences:
-        basin_file_write.write(i)
-        basin_file_write.write('\n')
-    basin_file_write.close()
+    apply_curve_numbers(BASIN_PATH,subbasin_ids,cn_vals)
+
+def apply_curve_numbers(BASIN_PATH,subbasin_ids,cn_vals):
+    basin_hms_file = load_hms_file(BASIN_PATH)
+    for subbasin_id,cn_val in zip(subbasin_ids,cn_vals):
+        basin_hms_file.set_field('Subbasin',str(subbasin_id),'Curve Number',cn_val)
+    basin_hms_file.save()
+
+def curve_number_sets(constants_dict,CN_PATH):
+    ##scenario name -> (subbasin ids, cn values)
+    ##CN_SCENARIOS is 'name:csv;name:csv' with the Name,CN3 layout of CN_GODAVARI, otherwise one set per cn_type of the task CURVE_NUMBER file
+    cn_sets = {}
+    if constants_dict.get('CN_SCENARIOS'):
+        for scenario in constants_dict['CN_SCENARIOS'].split(';'):
+            scenario_name,cn_csv = scenario.split(':',1)
+            cn_data = pd.read_csv(cn_csv,header=0,index_col=False)
+            cn_sets[scenario_name.strip()] = (cn_data['Name'].to_list(),cn_data['CN3'].to_list())
+    else:
+        cn_data = pd.read_csv(CN_PATH,header=None,index_col=False,names =CN_HEADER_NAMES)
+        for cn_type,cn_group in cn_data.groupby('cn_type',sort=False):
+            cn_sets[str(cn_type)] = (cn_group['subbasin_id'].to_list(),cn_group['cn_val'].to_list())
+    return cn_sets
 
 def gage_file_date_parsing(date_value,offset):
     day = str(date_value.day)
@@ -394,438 +748,1180 @@ def gage_file(constants_dict, start_date, forecast_date, end_date):
     obs_enddate_string = gage_file_date_parsing(forecast_date,1)
     end_date_string = gage_file_date_parsing(forecast_date,0)
 
-    with open(constants_dict['GAGE_FILE_PATH'],'r') as gage_file:
-        gage_file_data = gage_file.read()
-
-    word_1 = 'Gage:'
-    word_2 = 'End:'
-
-    sentences = gage_file_data.split('\n')
-
-    idx1 = []
-    idx2 = []
-    for i in range(len(sentences)):
-        if word_1 in sentences[i]:
-            idx1.append(i)
-        if word_2 in sentences[i]:
-            idx2.append(i)
-
-    idx2 = idx2[1:]
-
-    for i in range(len(idx1)):
-        clip_sentences = sentences[idx1[i]:idx2[i]+1]
-
-        clip_sentences[-4] = '       '+'Start Time:'+' '+ start_date_string              #'1 January 2021, 12:00'
-        clip_sentences[-3] = '       '+'End Time:'+' '+ end_date_string                     #'26 January 2021, 12:00'
-        for j in range(len(clip_sentences)):
-            sentences[idx1[i]+j] = clip_sentences[j]
+    gage_hms_file = load_hms_file(constants_dict['GAGE_FILE_PATH'])
+    gage_hms_file.set_field('Gage',None,'Start Time',start_date_string,last_only=True)              #'1 January 2021, 12:00'
+    gage_hms_file.set_field('Gage',None,'End Time',end_date_string,last_only=True)                  #'26 January 2021, 12:00'
 
     # obs_stns_data = pd.read_csv(OBS_DSS_FILE_PATH,header = 0,index_col=False)
     # obs_stns = obs_stns_data['Gage_name'].to_list()
-    
     # for j in obs_stns:
-    #     word_1 = 'Gage: '+ j
-    #     word_2 = 'End:'
-    #     start = []
-    #     end = []
-        
-    #     for k in range(len(sentences)):
-    #         if word_1 not in sentences[k]:
-    #             continue
-    #         else:
-    #             start.append(k)
-    #             break
-
-    #     for l in idx2:
-    #         if start[0] > l:
-    #             continue
-    #         else:
-    #             end.append(l)
-    #             break
-
-    #     for x in range(len(start)):
-    #         clip_sentences = sentences[start[x]:end[x]+1]
-    #         clip_sentences[-4] = '       '+'Start Time:'+' '+ obs_startdate_string              #'1 January 2021, 12:00'
-    #         clip_sentences[-3] = '       '+'End Time:'+' '+ obs_enddate_string                     #'26 January 2021, 12:00'
-    #         for y in range(len(clip_sentences)):
-    #             sentences[start[x]+y] = clip_sentences[y]
-
-    open(constants_dict['GAGE_FILE_PATH'],"w").close()
-
-    gage_file_write = open(constants_dict['GAGE_FILE_PATH'],"w+")
-
-    for i in sentences:
-        gage_file_write.write(i)
-        gage_file_write.write('\n')
-    gage_file_write.close()
-
-def sc_merge(constants_dict,INPUT_FILE):
-    sc_map = {}
-
-    with open(constants_dict['SC_METADATA_PATH']) as sc_file:
+    #     gage_hms_file.set_field('Gage',j,'Start Time',obs_startdate_string,last_only=True)      #'1 January 2021, 12:00'
+    #     gage_hms_file.set_field('Gage',j,'End Time',obs_enddate_string,last_only=True)          #'26 January 2021, 12:00'
+
+    gage_hms_file.save()
+
+sc_topology_cache = {}
+
+def sc_topology(sc_metadata_path):
+    ##targets x contributors matrix of +1 (add) and -1 (remove), compiled again only when the metadata file changes
+    sc_stat = os.stat(sc_metadata_path)
+    cache_key = (sc_stat.st_mtime_ns,sc_stat.st_size)
+    if sc_topology_cache.get(sc_metadata_path,(None,))[0] == cache_key:
+        return sc_topology_cache[sc_metadata_path][1]
+
+    targets = {}
+    contributors = {}
+    rows = []
+    cols = []
+    signs = []
+    base_stn = None
+    with open(sc_metadata_path) as sc_file:
         datareader = csv.reader(sc_file)
         for row in datareader:
-            if row[0] in sc_map.keys():
-                if row[2] == 'add':
-                    sc_map[row[0]]['add'].append(row[1])
-                else:
-                    sc_map[row[0]]['remove'].append(row[1])
-            else:
-                sc_map[row[0]] = {}
-                sc_map[row[0]]['add'] = []
-                sc_map[row[0]]['remove'] = []
-                if row[2] == 'add':
-                    sc_map[row[0]]['add'].append(row[1])
-                else:
-                    sc_map[row[0]]['remove'].append(row[1])
-
-    sc_output_csv = pd.read_csv(constants_dict['SC_INPUT_CSV_PATH']+INPUT_FILE, header=None, index_col=False, names=SC_HEADER_NAMES)
-    sc_metadata = pd.read_csv(constants_dict['SC_METADATA_PATH'],header=None, index_col=False).iloc[0].iloc[1]
-
-    final_df = pd.DataFrame()
-
-    base_df = (sc_output_csv[sc_output_csv['stn'] == sc_metadata].iloc[:, 1:-1]).reset_index(drop = True)
-
-    sc_points = list(sc_map.keys())
-    # print(sc_points)
-    for stn in sc_points:
-        add_remove_map = sc_map[stn]
-        stn_df = pd.DataFrame()
-        for i in list(add_remove_map.keys()):
-            for sc in sc_map[stn][i]:
-                # print(sc)
-                sub_df = (sc_output_csv[sc_output_csv['stn'] == sc].iloc[:, -1:]).reset_index(drop = True)
-                if stn_df.empty:
-                    stn_df = pd.concat([stn_df,sub_df],axis=0)
-                else:
-                    stn_df = stn_df.add(sub_df)
-        merge_df = pd.concat([base_df,stn_df],axis=1)
-        merge_df.insert(0, 'stn', stn)
-        
-        final_df = pd.concat([final_df,merge_df],axis=0)
+            if base_stn is None:
+                base_stn = row[1]    ##time columns of the merged output are taken from the first contributor
+            rows.append(targets.setdefault(row[0],len(targets)))
+            cols.append(contributors.setdefault(row[1],len(contributors)))
+            signs.append(1.0 if row[2] == 'add' else -1.0)
+
+    matrix = scipy.sparse.csr_matrix((signs,(rows,cols)),shape=(len(targets),len(contributors)))
+    topology = {'targets':list(targets.keys()),'contributors':list(contributors.keys()),'matrix':matrix,'base_stn':base_stn}
+    sc_topology_cache[sc_metadata_path] = (cache_key,topology)
+    return topology
+
+def sc_merge(constants_dict,INPUT_FILE,sc_output_csv=None):
+    ##sc_output_csv is the extracted self catchment frame, read from SC_INPUT_CSV_PATH when the jython script wrote it
+    topology = sc_topology(constants_dict['SC_METADATA_PATH'])
+
+    if sc_output_csv is None:
+        sc_output_csv = pd.read_csv(constants_dict['SC_INPUT_CSV_PATH']+INPUT_FILE, header=None, index_col=False, names=SC_HEADER_NAMES)
+        ##undefined steps before a warm start state date, converted to cusecs by the script
+        sc_output_csv = sc_output_csv[sc_output_csv['flow_cusecs'] > UNDEFINED].reset_index(drop=True)
+
+    base_df = (sc_output_csv[sc_output_csv['stn'] == topology['base_stn']].iloc[:, 1:-1]).reset_index(drop = True)
+    n_steps = len(base_df)
+
+    ##stations x timesteps, rows of each station are matched by position like the base station rows
+    steps = sc_output_csv.groupby('stn').cumcount()    ##the caller's frame is left as it is
+    flows = sc_output_csv.assign(step=steps).pivot(index='stn',columns='step',values='flow_cusecs')
+    flows = flows.reindex(index=topology['contributors'],columns=range(n_steps))
+    missing = flows.index[flows.isna().all(axis=1)].tolist()
+    if missing:
+        logging.info('self catchment points missing in output :: %s',missing)
+    merged = topology['matrix'].dot(flows.fillna(0).values)
+
+    final_df = pd.concat([base_df]*len(topology['targets']),axis=0,ignore_index=True)
+    final_df.insert(0,'stn',np.repeat(topology['targets'],n_steps))
+    final_df['flow_cusecs'] = merged.ravel()
 
     final_df.to_csv(constants_dict['SC_OUTPUT_FILE_PATH']+INPUT_FILE,header = False,index=False)
+    if constants_dict.get('COLUMNAR_OUTPUT','false') == 'true':
+        write_columnar_output(final_df,constants_dict['SC_OUTPUT_FILE_PATH']+INPUT_FILE)
+
+def forecast_flow_catalog(dss_file,dss_name):
+    ##point (B part) -> condensed pathname of its 30 minute forecast flow record, like catalog_index in dssoutput.py
+    catalog = {}
+    for pathname in dss_file.getPathnameList('/*/*/FLOW/*/30MIN/FOR:'+dss_name+'/'):
+        parts = pathname.split('/')
+        if len(parts) < 8 or parts[3] != 'FLOW' or parts[5] != '30MIN' or parts[6] != 'FOR:'+dss_name:
+            continue
+        catalog[parts[2]] = '/'+parts[1]+'/'+parts[2]+'/'+parts[3]+'//'+parts[5]+'/'+parts[6]+'/'
+    return catalog
+
+def forecast_flow_frame(dss_file,catalog,stations,flow_type,window):
+    ##rows of the 13 column fc/sc layout for [(station name, point)], whole window per record and only the :30 values like dssoutput.py
+    names = []
+    times = []
+    flows = []
+    for station_name,point in stations:
+        if point not in catalog:
+            print('path doesnt exist -- ','//'+point+'/FLOW//30MIN/')
+            continue
+        tsc = dss_file.read_ts(catalog[point],window=window,trim_missing=False)
+        record_times = np.asarray(tsc.times,dtype=np.int64)
+        record_values = np.asarray(tsc.values,dtype=np.float64)
+        keep = (record_times % 60 != 0) & (record_values > UNDEFINED)    ##steps hms did not compute are undefined
+        names.append(np.full(keep.sum(),station_name,dtype=object))
+        times.append(record_times[keep])
+        flows.append(record_values[keep]*CUSECS_FACTOR)
+    if not names:
+        return pd.DataFrame({name:[] for name in SC_HEADER_NAMES})
+    step = pd.DatetimeIndex(HEC_EPOCH+np.concatenate(times).astype('timedelta64[m]'))
+    expiry = step+pd.Timedelta(minutes=59)
+    columns = [np.concatenate(names),flow_type]
+    columns += [np.asarray(values,dtype=np.int64) for values in [step.year,step.month,step.day,step.hour,step.minute,
+                                                                  expiry.year,expiry.month,expiry.day,expiry.hour,expiry.minute]]
+    return pd.DataFrame(dict(zip(SC_HEADER_NAMES,columns+[np.concatenate(flows)])))
+
+def flow_csv_text(flow_df):
+    ##rows as dssoutput.py writes them: zero padded dates, unpadded step hour and minute, flows as jython str() gives them (12 significant digits).
+    ##the date columns are formatted once per distinct time step, every station repeats the same steps
+    step_key = np.zeros(len(flow_df),dtype=np.int64)
+    for column,size in [('year',10000),('month',13),('day',32),('hour',24),('minute',60),('ex_month',13),('ex_day',32),('ex_hour',24),('ex_minute',60)]:
+        step_key = step_key*size+flow_df[column].to_numpy(dtype=np.int64)    ##expiry year is the step year or the next one
+    step_key = step_key*2+(flow_df['ex_year'].to_numpy(dtype=np.int64)-flow_df['year'].to_numpy(dtype=np.int64))
+    step_keys,first_row,step_index = np.unique(step_key,return_index=True,return_inverse=True)
+    step_rows = flow_df[SC_HEADER_NAMES[2:-1]].to_numpy(dtype=np.int64)[first_row]
+    step_text = np.array(['%04d,%02d,%02d,%d,%d,%04d,%02d,%02d,%02d,%02d' % tuple(step) for step in step_rows.tolist()],dtype=object)
+    rows = zip(flow_df['stn'].astype(str).tolist(),flow_df['type'].astype(str).tolist(),step_text[step_index].tolist(),
+               [jython_float_text(flow) for flow in flow_df['flow_cusecs'].tolist()])
+    return ''.join(','.join(row)+'\n' for row in rows)
+
+def jython_float_text(flow):
+    ##str() of a jython float, 12 significant digits and whole numbers keep their .0 (0.0, 100.0, but 1e+20)
+    text = '%.12g' % flow
+    if text.lstrip('-').isdigit():
+        text += '.0'
+    return text
+
+def metadata_stations(metadata_csv):
+    with open(metadata_csv) as stations_file:
+        metadata = csv.reader(stations_file)
+        next(metadata)
+        return [(row[0],row[1]) for row in metadata]
+
+def extract_forecast_outputs(constants_dict,input_folder,dss_name,start_date,end_date):
+    ##in process replacement for dssoutput.py and the self catchment script, both read from the forecast output dss in one open
+    ##returns the full catchment and self catchment frames, the full catchment csv is written to OUTPUT_DIR like dssoutput.py does
+    window = (start_date.strftime('%d%b%Y').upper()+' 00:00:00',end_date.strftime('%d%b%Y').upper()+' 24:00:00')
+    dss_file = HecDss.Open(constants_dict['MODEL_PATH']+dss_name+'.dss')
+    try:
+        catalog = forecast_flow_catalog(dss_file,dss_name)
+        fc_df = pd.concat([forecast_flow_frame(dss_file,catalog,metadata_stations(constants_dict['INFLOWS_METADATA_CSV']),'inflow',window),
+                           forecast_flow_frame(dss_file,catalog,metadata_stations(constants_dict['OUTFLOWS_METADATA_CSV']),'outflow',window)],
+                          ignore_index=True)
+        contributors = sc_topology(constants_dict['SC_METADATA_PATH'])['contributors']
+        sc_df = forecast_flow_frame(dss_file,catalog,[(point,point) for point in contributors],constants_dict.get('SC_FLOW_TYPE','outflow'),window)
+    finally:
+        dss_file.close()
+
+    with open(constants_dict['OUTPUT_DIR']+input_folder,'w') as fc_file:
+        fc_file.write(flow_csv_text(fc_df))
+    return fc_df,sc_df
+
+def flow_output_frame(flow_df):
+    ##typed version of the 13 column fc/sc csv layout
+    timestamp = pd.to_datetime(pd.DataFrame({'year':flow_df['year'],'month':flow_df['month'],'day':flow_df['day'],
+                                             'hour':flow_df['hour'],'minute':flow_df['minute']}))
+    expiry = pd.to_datetime(pd.DataFrame({'year':flow_df['ex_year'],'month':flow_df['ex_month'],'day':flow_df['ex_day'],
+                                          'hour':flow_df['ex_hour'],'minute':flow_df['ex_minute']}))
+    return pd.DataFrame({'stn':flow_df['stn'].astype(str).astype('category').values,
+                         'type':flow_df['type'].astype(str).astype('category').values,
+                         'timestamp':timestamp.values,
+                         'expiry':expiry.values,
+                         'flow_cusecs':flow_df['flow_cusecs'].astype(np.float32).values})
+
+def write_columnar_output(flow_df,output_file):
+    ##parquet copy next to the csv, the csv stays the default output
+    flow_output_frame(flow_df).to_parquet(output_file+COLUMNAR_SUFFIX,index=False)
+
+def columnar_server_path(server_path):
+    if server_path.endswith('/'):
+        return server_path
+    return server_path+COLUMNAR_SUFFIX
 
 def server_file_upload(constants_dict,FINAL_OUT_DIR, OUTPUT_FILENAME,SERVER_PATH_TO_UPLOAD):
-    model_output_file = constants_dict['SERVER_SCP']+" "+FINAL_OUT_DIR+OUTPUT_FILENAME+" "+constants_dict['SERVER_IP']+":"+SERVER_PATH_TO_UPLOAD
-    cmd = os.system(model_output_file)
-    print(cmd)
-    return cmd
-
-def main():   ##TODO upon exception extracting data from backup folder.
-    while(True):
-        try:
+    ##0 when uploaded and verified, 1 when every retry failed
+    return 0 if get_transfer(constants_dict).upload(FINAL_OUT_DIR+OUTPUT_FILENAME,SERVER_PATH_TO_UPLOAD) else 1
+
+def load_constants(constants_path=HMS_CONSTANTS_FILE):
+    # constants_metadata = pd.read_excel(HMS_CONSTANTS_FILE,header=0, index_col= None,sheet_name=0)   ##creation constants from constants file
+    # constants_dict = dict(zip(constants_metadata.constant, constants_metadata.path))
+    constants_dict = {}
+    with open(constants_path) as constants_file:
+        for row in csv.reader(constants_file):
+            constants_dict[row[0]] = row[1]
+    return constants_dict
+
+def write_constants(constants_dict,constants_path):
+    with open(constants_path,'w') as constants_file:
+        writer = csv.writer(constants_file,delimiter=',',lineterminator = '\n')
+        for key,value in constants_dict.items():
+            writer.writerow([key,value])
+
+def rebase_path(path,mappings):
+    for src,dst in mappings:
+        if path == src.rstrip('/') or path.startswith(src):
+            return dst + path[len(src):]
+    return None
+
+def relocate_project_file(constants_dict,path):
+    ##points absolute paths inside hms project files at the task workspace instead of the shared folders
+    if 'WORKSPACE_MAPPINGS' not in constants_dict:
+        return
+    with open(path,'r') as project_file:
+        project_data = project_file.read()
+    relocated_data = project_data
+    for mapping in constants_dict['WORKSPACE_MAPPINGS'].split(';'):
+        src,dst = mapping.split('>')
+        relocated_data = relocated_data.replace(src,dst)
+    if relocated_data != project_data:
+        with open(path,'w') as project_file:
+            project_file.write(relocated_data)
+
+def create_task_workspace(constants_dict,task_id):
+    ##every task gets a private copy of the model, metadata file and dss folders so that concurrent tasks never edit the same files
+    workspace = constants_dict.get('WORKSPACE_DIR',DEFAULT_WORKSPACE_DIR) + task_id + '/'
+    if os.path.exists(workspace):
+        shutil.rmtree(workspace)
+    model_out_dir = workspace + 'model_out/'
+    if constants_dict.get('MODEL_RESET','template') == 'template':
+        clone_tree(model_template(constants_dict),model_out_dir)
+    else:
+        os.makedirs(model_out_dir)
+        with ZipFile(constants_dict['BACKUP_FOLDER']+'nodes_data.zip', 'r') as zipObj:
+            zipObj.extractall(model_out_dir)
+
+    task_constants = dict(constants_dict)
+    mappings = [(constants_dict['MODEL_OUT_DIR'].rstrip('/')+'/', model_out_dir)]
+    for key in ['MODEL_OUT_DIR','MODEL_OUT_DIR_FILE']:
+        task_constants[key] = rebase_path(constants_dict[key],mappings)
+
+    for key in WORKSPACE_DIR_KEYS + WORKSPACE_OUTPUT_DIR_KEYS:
+        if key not in constants_dict:
+            continue
+        path = rebase_path(constants_dict[key],mappings)
+        if path is None:
+            path = workspace + key.lower() + '/'
+            if key in WORKSPACE_DIR_KEYS and os.path.isdir(constants_dict[key]):
+                shutil.copytree(constants_dict[key],path)
+            else:
+                os.makedirs(path)
+            mappings.append((constants_dict[key].rstrip('/')+'/', path))
+        task_constants[key] = path
+
+    for key in WORKSPACE_FILE_KEYS:
+        if key not in constants_dict:
+            continue
+        path = rebase_path(constants_dict[key],mappings)
+        if path is None:
+            path = workspace + os.path.basename(constants_dict[key])
+            if os.path.isfile(constants_dict[key]):
+                shutil.copyfile(constants_dict[key],path)
+        task_constants[key] = path
+
+    task_constants['WORKSPACE'] = workspace
+    task_constants['WORKSPACE_MAPPINGS'] = ';'.join(src+'>'+dst for src,dst in mappings)
+    task_constants['HMS_CONSTANTS_FILE'] = workspace + 'constants.csv'
+    for name in os.listdir(task_constants['MODEL_PATH']):
+        if name.endswith(HMS_PROJECT_EXTENSIONS):
+            relocate_project_file(task_constants,task_constants['MODEL_PATH']+name)
+    write_constants(task_constants,task_constants['HMS_CONSTANTS_FILE'])
+    logging.info('workspace created :: %s',workspace)
+    return task_constants
+
+def reset_model_state(constants_dict):
+    ##isolated workspaces are thrown away after the task, only the shared model folders need resetting
+    if 'WORKSPACE' in constants_dict:
+        return
+    delete_extract_dir(constants_dict)
+    delete_obs_discharge(constants_dict)
+
+class HmsSession(object):
+    ##one hec-hms jvm per worker running hms_session.py, commands go over its stdin and replies come back on stdout
+    def __init__(self,constants_dict):
+        self.script_path = constants_dict['HMS_SESSION_SCRIPT_PATH']
+        self.process = subprocess.Popen(['./hec-hms.sh','-script',self.script_path],cwd=constants_dict['HMS_DIR_PATH'],
+                                        stdin=subprocess.PIPE,stdout=subprocess.PIPE,universal_newlines=True)
+        logging.info('hms session started :: pid %s',self.process.pid)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def call(self,**command):
+        self.process.stdin.write(json.dumps(command)+'\n')
+        self.process.stdin.flush()
+        for line in self.process.stdout:
+            if line.startswith(HMS_SESSION_REPLY_PREFIX):
+                reply = json.loads(line[len(HMS_SESSION_REPLY_PREFIX):])
+                if reply['status'] != 'ok':
+                    raise Exception('hms session error :: '+reply['message'])
+                return reply
+            print(line.rstrip('\n'))
+        raise Exception('hms session exited with code '+str(self.process.wait()))
+
+    def close(self):
+        if self.alive():
             try:
-                try:                
-                    # constants_metadata = pd.read_excel(HMS_CONSTANTS_FILE,header=0, index_col= None,sheet_name=0)   ##creation constants from constants file
-                    # constants_dict = dict(zip(constants_metadata.constant, constants_metadata.path))
-                    constants_file = csv.reader(open(HMS_CONSTANTS_FILE))
-                    constants_dict = {}
-                    for row in constants_file:
-                        constants_dict[row[0]] = row[1]
-                except Exception as e:
-                    send_error_email(e,'constant file importing error')
-                    print("invalid constant file :: ",e)
-                    continue
-
-                try:  
-                    response = requests.get(constants_dict['REQUEST_API'])               ##getting response from server
-                except Exception as e:
-                    send_error_email(e,'Server response error')
-                    print("Server response error :: ",e)
-                    time.sleep(60)
-                    continue
-                print("status code :: %s",str(response.status_code))  ## printing response status code
-                
-                if response.status_code != 200:             ##if status code is not 200 sleep 30 ms and hit again
-                    time.sleep(900)
-                    continue
-                
-                try:        
-                    UUID = response.json().get(UUID_STRING)    ##getting UUID of the task given
-                    print(response.json())
-                except Exception as e:
-                    send_error_email(e,'Error no UUID_String')
-                    print("Error no UUID_String :: ",e)
-                    continue
-                
-                try:
-                    INPUT_PATH = response.json().get('dex').get(INPUT_PATH_STRING)  ##getting Input path of data from server
-                except Exception as e:
-                    send_error_email(e,'Input path error in request')
-                    print("Input path error in request :: ",e)
-                    continue
-                
-                try:
-                    FC_OUTPUT_PATH = response.json().get('dex').get(FC_OUTPUT_PATH_STRING)  ##getting full catchment output path from the server
-                except Exception as e:
-                    send_error_email(e,'Full catchment output path error')
-                    print("Full catchment output path error :: ",e)
-                    continue
+                self.call(cmd='close')
+            except Exception as e:
+                logging.info(e)
+            self.process.stdin.close()
+            self.process.wait()
+
+hms_session = None
+
+def get_hms_session(constants_dict):
+    global hms_session
+    if hms_session is None or not hms_session.alive() or hms_session.script_path != constants_dict['HMS_SESSION_SCRIPT_PATH']:
+        if hms_session is not None:
+            hms_session.close()
+        hms_session = HmsSession(constants_dict)
+        atexit.register(hms_session.close)
+    return hms_session
+
+def run_hms_script(constants_dict,script_path):
+    ##hms scripts read the constants file named in HMS_CONSTANTS_FILE, which points to the task workspace copy in worker pool mode
+    constants_path = constants_dict.get('HMS_CONSTANTS_FILE',HMS_CONSTANTS_FILE)
+    if constants_dict.get('HMS_SESSION_SCRIPT_PATH'):
+        get_hms_session(constants_dict).call(cmd='script',path=script_path,constants=constants_path)
+        return 0
+    env = dict(os.environ)
+    env['HMS_CONSTANTS_FILE'] = constants_path
+    return subprocess.call(['./hec-hms.sh','-script',script_path],cwd=constants_dict['HMS_DIR_PATH'],env=env)
+
+def run_hms_compute(constants_dict,forecast_to_compute):
+    ##the session keeps the project open between stages and tasks, otherwise blend_run.py opens it in a new jvm
+    if constants_dict.get('HMS_SESSION_SCRIPT_PATH'):
+        get_hms_session(constants_dict).call(cmd='compute',project=constants_dict['HMS_PROJ_FILE'],forecast=forecast_to_compute)
+        return 0
+    return run_hms_script(constants_dict,constants_dict['FORECAST_SCRIPT_FILE_PATH'])
+
+def create_scenario_workspace(constants_dict,scenario_dir,rainfall_dss_path):
+    ##copy of the prepared model folder without its rainfall dss, the scenario grid file reads rainfall_dss_path instead
+    ##(the model's own rainfall dss for curve number scenarios, a member rainfall dss of the same name for ensemble members)
+    if os.path.exists(scenario_dir):
+        shutil.rmtree(scenario_dir)
+    model_path = constants_dict['MODEL_PATH'].rstrip('/')+'/'
+    scenario_model_path = scenario_dir + 'model/'
+    rainfall_dss_path = os.path.abspath(rainfall_dss_path)
+    model_rainfall_dss_path = os.path.abspath(constants_dict['MODEL_INPUT_DSS_PATH'].rstrip('/')+'/'+os.path.basename(rainfall_dss_path))
+    shutil.copytree(model_path,scenario_model_path,
+                    ignore=lambda folder,names: [name for name in names if os.path.abspath(os.path.join(folder,name)) == model_rainfall_dss_path])
+
+    scenario_constants = dict(constants_dict)
+    mappings = [(model_path,scenario_model_path)]
+    for key in WORKSPACE_DIR_KEYS + WORKSPACE_FILE_KEYS:
+        path = rebase_path(constants_dict.get(key,''),mappings)
+        if path is not None:
+            scenario_constants[key] = path
+    scenario_constants['OUTPUT_DIR'] = scenario_dir + 'output/'
+    os.makedirs(scenario_constants['OUTPUT_DIR'])
+    scenario_constants['WORKSPACE_MAPPINGS'] = model_path+'>'+scenario_model_path
+    scenario_constants['HMS_CONSTANTS_FILE'] = scenario_dir + 'constants.csv'
+    scenario_constants['HMS_SESSION_SCRIPT_PATH'] = ''   ##scenarios compute side by side, each in its own jvm
+    for name in os.listdir(scenario_model_path):
+        if name.endswith(HMS_PROJECT_EXTENSIONS):
+            relocate_project_file(scenario_constants,scenario_model_path+name)
+
+    point_grid_dss(scenario_constants['GRID_FILE_PATH'],rainfall_dss_path)
+    write_constants(scenario_constants,scenario_constants['HMS_CONSTANTS_FILE'])
+    return scenario_constants
+
+def prepare_cn_scenarios(constants_dict,runtype,CN_PATH,input_folder,rainfall_dss_path):
+    ##one model copy per curve number set, made after the task files are edited and before anything computes
+    scenario_root = model_copy_root(constants_dict,input_folder,'cn_scenarios')
+    basin_key = 'VIRGIN_BASIN_FILE_PATH' if runtype == 'ENSEMBLE_FORECAST' else 'BASIN_FILE_PATH'
+    scenarios = {}
+    for scenario_name,(subbasin_ids,cn_vals) in curve_number_sets(constants_dict,CN_PATH).items():
+        scenario_constants = create_scenario_workspace(constants_dict,scenario_root+scenario_name+'/',rainfall_dss_path)
+        if not scenario_constants[basin_key].startswith(scenario_root):
+            raise Exception(basin_key+' is outside MODEL_PATH, scenarios would edit the shared basin file')
+        apply_curve_numbers(scenario_constants[basin_key],subbasin_ids,cn_vals)
+        scenarios[scenario_name] = scenario_constants
+    return scenarios
+
+def model_copy_root(constants_dict,input_folder,kind):
+    return constants_dict.get('WORKSPACE',constants_dict.get('WORKSPACE_DIR',DEFAULT_WORKSPACE_DIR)+input_folder+'/') + kind + '/'
+
+def run_model_copy(scenario_constants):
+    run_hms_script(scenario_constants,scenario_constants['FORECAST_SCRIPT_FILE_PATH'])
+    run_hms_script(scenario_constants,scenario_constants['DSSSCRIPT_FILE_PATH'])
+
+def start_model_copies(scenarios,workers=None):
+    ##every copy computes in its own hec-hms jvm, the threads only wait on those processes
+    executor = ThreadPoolExecutor(max_workers=max(min(len(scenarios),workers or len(scenarios)),1))
+    futures = {scenario_name:executor.submit(run_model_copy,scenario_constants) for scenario_name,scenario_constants in scenarios.items()}
+    executor.shutdown(wait=False)
+    return futures
+
+def model_copy_outputs(scenarios,futures,input_folder,kind):
+    ##full catchment output of every model copy that computed, copies that failed are logged and left out
+    copy_outputs = {}
+    for scenario_name,future in futures.items():
+        try:
+            future.result()
+            copy_outputs[scenario_name] = pd.read_csv(scenarios[scenario_name]['OUTPUT_DIR']+input_folder,header=None,index_col=False,names=SC_HEADER_NAMES)
+        except Exception as e:
+            logging.info('%s %s failed :: %s',kind,scenario_name,e)
+    if not copy_outputs:
+        raise Exception('no '+kind+' produced output')
+    return copy_outputs
+
+def release_model_copies(model_copies):
+    ##model_copies: [(futures, paths)] registered by the task. copies that did not start are cancelled,
+    ##running ones are waited for before their folders are removed, however the task ended
+    for futures,paths in model_copies:
+        for future in futures.values():
+            future.cancel()
+        wait(list(futures.values()))
+        for path in paths:
+            shutil.rmtree(path,ignore_errors=True)
+
+def cn_scenario_outputs(constants_dict,scenarios,futures,input_folder):
+    ##full catchment flows per scenario as <input folder>_cn_<scenario> and min/median/max per row as <input folder>_cn_envelope
+    out_dir = constants_dict['FINAL_OUT_PATH']+FC_OUTPUT+'/'
+    key_names = SC_HEADER_NAMES[:-1]
+    scenario_flows = {}
+    for scenario_name,flow_df in model_copy_outputs(scenarios,futures,input_folder,'curve number scenario').items():
+        flow_df.to_csv(out_dir+input_folder+'_cn_'+scenario_name,header=False,index=False)
+        scenario_flows[scenario_name] = flow_df.set_index(key_names)['flow_cusecs']
+
+    flows = pd.concat(scenario_flows,axis=1)
+    envelope = pd.DataFrame({'flow_min':flows.min(axis=1),'flow_median':flows.median(axis=1),'flow_max':flows.max(axis=1)}).reset_index()
+    envelope.to_csv(out_dir+input_folder+'_cn_envelope',header=False,index=False)
+    logging.info('cn scenarios written :: %s',','.join(scenario_flows))
+    return list(scenario_flows)
+
+def ensemble_members(input_grid_data,prefix):
+    ##member grids of an ENS task sit in <input folder>/<prefix><member>/YYYYMMDD, next to the ensemble mean grids
+    if isinstance(input_grid_data,InputArchive):
+        names = [name.split('/')[1] for name in input_grid_data.names if name.count('/') >= 2 and name.split('/')[0] == input_grid_data.folder]
+    elif os.path.isdir(input_grid_data):
+        names = [name for name in os.listdir(input_grid_data) if os.path.isdir(input_grid_data+name)]
+    else:
+        names = []
+    return sorted(set(name for name in names if name.startswith(prefix)))
+
+def member_grid_data(input_grid_data,member):
+    if isinstance(input_grid_data,InputArchive):
+        return input_grid_data.subfolder(member)
+    return input_grid_data+member+'/'
+
+def prepare_ensemble_members(constants_dict,start_date,end_date,input_grid_data,input_folder,input_dss_name):
+    ##one rainfall dss per member under DSS_FILE_PATH/<input folder>_members/<member>/, named like the ensemble mean one so the grid file only changes folder
+    members = ensemble_members(input_grid_data,constants_dict.get('ENS_MEMBER_PREFIX','member_'))
+    members_dir = constants_dict['DSS_FILE_PATH']+input_folder+'_members/'
+    if os.path.exists(members_dir):
+        shutil.rmtree(members_dir)
+    os.mkdir(members_dir)
+    member_dss = {}
+    for member in members:
+        rainfall_dss_prepare(constants_dict,start_date,end_date,member_grid_data(input_grid_data,member),input_folder+'_members/'+member,input_dss_name)
+        member_dss[member] = members_dir+member+'/'+input_dss_name+'.dss'
+    return member_dss
+
+def prepare_ensemble_copies(constants_dict,member_dss,input_folder):
+    ##one model copy per member, made after the task files are edited, each grid file pointing at its member rainfall dss
+    member_root = model_copy_root(constants_dict,input_folder,'ens_members')
+    return {member:create_scenario_workspace(constants_dict,member_root+member+'/',dss_path) for member,dss_path in member_dss.items()}
+
+def ensemble_server_path(server_path,suffix):
+    if server_path.endswith('/'):
+        return server_path
+    return server_path+suffix
+
+def ensemble_percentile_outputs(constants_dict,members,futures,input_folder):
+    ##per station and time step percentiles across the members, each percentile as <input folder>_ens_p<percentile> in the fc layout
+    out_dir = constants_dict['FINAL_OUT_PATH']+FC_OUTPUT+'/'
+    percentiles = [int(percentile) for percentile in constants_dict.get('ENS_PERCENTILES','10,50,90').split(',')]
+    key_names = SC_HEADER_NAMES[:-1]
+    member_flows = {member:flow_df.set_index(key_names)['flow_cusecs'] for member,flow_df in model_copy_outputs(members,futures,input_folder,'ensemble member').items()}
+    flows = pd.concat(member_flows,axis=1)    ##rows are station/time steps, columns are members, a row missing in a member is nan
+    flow_percentiles = np.nanpercentile(flows.to_numpy(dtype=np.float64),percentiles,axis=1)
+
+    output_files = []
+    for percentile,percentile_flows in zip(percentiles,flow_percentiles):
+        output_file = input_folder+'_ens_p'+str(percentile)
+        percentile_df = flows.index.to_frame(index=False)
+        percentile_df['flow_cusecs'] = percentile_flows
+        percentile_df.to_csv(out_dir+output_file,header=False,index=False)
+        output_files.append(output_file)
+    logging.info('ensemble percentiles written from %d of %d members :: %s',len(member_flows),len(members),','.join(output_files))
+    return output_files
+
+class PollBackoff(object):
+    ##wait before the next REQUEST_API poll, doubles while the server has no task or fails and resets once it answers with a task
+    def __init__(self,constants_dict):
+        self.min_wait = float(constants_dict.get('POLL_MIN_INTERVAL',30))
+        self.max_wait = float(constants_dict.get('POLL_MAX_INTERVAL',900))
+        self.wait = 0
+
+    def failed(self,retry_after=None):
+        self.wait = min(max(self.wait*2,self.min_wait),self.max_wait)
+        try:
+            self.wait = max(self.wait,float(retry_after))
+        except (TypeError,ValueError):
+            pass
+
+    def claimed(self):
+        self.wait = 0
+
+def request_task(constants_dict,backoff=None):
+    ##with a backoff the caller does the waiting, otherwise the fixed sleeps of the polling loop are kept
+    try:  
+        poll_timeout = float(constants_dict['POLL_TIMEOUT']) if constants_dict.get('POLL_TIMEOUT') else None
+        response = requests.get(constants_dict['REQUEST_API'],timeout=poll_timeout)               ##getting response from server
+    except Exception as e:
+        send_error_email(e,'Server response error')
+        print("Server response error :: ",e)
+        if backoff is not None:
+            backoff.failed()
+        else:
+            time.sleep(60)
+        return None
+    print("status code :: %s",str(response.status_code))  ## printing response status code
+    
+    if response.status_code != 200:             ##if status code is not 200 sleep 30 ms and hit again
+        if backoff is not None:
+            backoff.failed(response.headers.get('Retry-After'))
+        else:
+            time.sleep(900)
+        return None
+    if backoff is not None:
+        backoff.claimed()
+    
+    try:        
+        UUID = response.json().get(UUID_STRING)    ##getting UUID of the task given
+        print(response.json())
+    except Exception as e:
+        send_error_email(e,'Error no UUID_String')
+        print("Error no UUID_String :: ",e)
+        return None
+    
+    try:
+        INPUT_PATH = response.json().get('dex').get(INPUT_PATH_STRING)  ##getting Input path of data from server
+    except Exception as e:
+        send_error_email(e,'Input path error in request')
+        print("Input path error in request :: ",e)
+        return None
+    
+    try:
+        FC_OUTPUT_PATH = response.json().get('dex').get(FC_OUTPUT_PATH_STRING)  ##getting full catchment output path from the server
+    except Exception as e:
+        send_error_email(e,'Full catchment output path error')
+        print("Full catchment output path error :: ",e)
+        return None
 
-                try:    
-                    SC_OUTPUT_PATH = response.json().get('dex').get(SC_OUTPUT_PATH_STRING)  ##getting self catchment output path from the server
-                except Exception as e:
-                    send_error_email(e,'self catchment output path error')
-                    print("self catchment output path error :: ",e)
-                    continue
+    try:    
+        SC_OUTPUT_PATH = response.json().get('dex').get(SC_OUTPUT_PATH_STRING)  ##getting self catchment output path from the server
+    except Exception as e:
+        send_error_email(e,'self catchment output path error')
+        print("self catchment output path error :: ",e)
+        return None
 
-                try:
-                    source = response.json().get('dex').get('source')  ##getting type of source from the task
-                except Exception as e:
-                    send_error_email(e,'source data error ')
-                    print("source data error :: ",e)
-                    continue
-                
-                if source == 'ACTUAL_SOURCE':    ##ignoring Actual_source task as there will be no forecast
-                    continue
-                
-                try:
-                    download_flow_file(constants_dict,INPUT_PATH,constants_dict['INPUT_GRID_DIR'])     ##downloading input data of the task
-                except Exception as e:
-                    send_error_email(e,source + ' :: '+'error downloading input file')
-                    print("error downloading input file :: ",e)
-                    continue
+    try:
+        source = response.json().get('dex').get('source')  ##getting type of source from the task
+    except Exception as e:
+        send_error_email(e,'source data error ')
+        print("source data error :: ",e)
+        return None
+    
+    if source == 'ACTUAL_SOURCE':    ##ignoring Actual_source task as there will be no forecast
+        return None
+
+    return {UUID_STRING:UUID, INPUT_PATH_STRING:INPUT_PATH, FC_OUTPUT_PATH_STRING:FC_OUTPUT_PATH, SC_OUTPUT_PATH_STRING:SC_OUTPUT_PATH, 'source':source}
+
+def run_task(constants_dict,task):
+    with pipeline_metrics.trace_task(constants_dict.get('METRICS_DIR'),task[UUID_STRING],task['source'],'task') as trace:
+        prepared = prepare_task(constants_dict,task)
+        completed = prepared is not None and compute_task(constants_dict,task,prepared)
+        if trace is not None and not completed:
+            trace.status = 'failed'
+
+def prepare_task(constants_dict,task):
+    ##download, unzip, rainfall and observed dss inputs of a task, nothing in the model folder is touched yet
+    UUID = task[UUID_STRING]
+    INPUT_PATH = task[INPUT_PATH_STRING]
+    source = task['source']
+
+    pipeline_metrics.stage('download')
+    input_zip = None
+    try:
+        if constants_dict.get('INPUT_CACHE','false') == 'true':   ##input zips are kept by content, a zip seen before is not downloaded again
+            input_zip = cached_input_archive(constants_dict,INPUT_PATH)
+        else:
+            download_flow_file(constants_dict,INPUT_PATH,constants_dict['INPUT_GRID_DIR'])     ##downloading input data of the task
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'error downloading input file')
+        print("error downloading input file :: ",e)
+        return
+
+    runtype = prepare_runtype(source)  ## if ENSEMBLE_DETERMINISTIC_FORECAST is source runtype is ENSEMBLE_DETERMINISTIC
+    print(runtype)
+    # source = 'IMD_FORECAST'
+    # runtype = prepare_runtype('ENSEMBLE_FORECAST')
+    # INPUT_FILE = '20230303_20230318_20230427_1679144521408.zip'
+    INPUT_FILE = INPUT_PATH.split('/')[-1]
+    INPUT_FOLDER_NAME = INPUT_FILE.split('.')[0]
+
+    try:
+        if os.path.exists(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/'):  ##if INPUT_GRID_DIR folder exisits delete the path
+            shutil.rmtree(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/')
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'error removing ' + constants_dict['INPUT_GRID_DIR']+ 'path')
+        print('error removing ' + constants_dict['INPUT_GRID_DIR']+ 'path',e)
+        return
+
+    pipeline_metrics.stage('unzip')
+    input_archive = None
+    try:
+        if input_zip is not None:    ##members are read straight from the cached zip, nothing is extracted
+            input_archive = InputArchive(input_zip,INPUT_FOLDER_NAME)
+        else:
+            with ZipFile(constants_dict['INPUT_GRID_DIR']+INPUT_FILE, 'r') as zipObj:  ##unziping input data
+                zipObj.extractall(constants_dict['INPUT_GRID_DIR'])
+    except Exception as e:
+        send_error_email(source + ' :: '+str(e),'unzip error of grid data ' + constants_dict['INPUT_GRID_DIR'])
+        print('unzippiing error :: ',e)
+        return
+    
+    try:
+        if input_archive is not None:
+            obs_file = input_archive.source(OBSERVED_DATA)
+        else:
+            os.chdir(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/')  #copying observed data from input data to observed data folder 
+            os.rename(OBSERVED_DATA , OBSERVED_DATA+'_'+INPUT_FOLDER_NAME)
+            shutil.move(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/'+OBSERVED_DATA+'_'+INPUT_FOLDER_NAME , constants_dict['OBS_FLOWS_DIR']+OBSERVED_DATA+'_'+INPUT_FOLDER_NAME)
+            obs_file = OBSERVED_DATA+'_'+INPUT_FOLDER_NAME
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'error copying observed flows file '+ OBSERVED_DATA+'_'+INPUT_FOLDER_NAME)
+        print('error copying observed flows file '+ OBSERVED_DATA+'_'+INPUT_FOLDER_NAME + ' :: ',e )
+        return
+    
+    try:
+        req_dates = INPUT_FOLDER_NAME.split('_')  ##getting simulation dates from input folder name
+        start_date = date_prepare(req_dates[0])
+        # start_date = datetime.date(int(2022),int(5),int(2))
+        forecast_date = date_prepare(req_dates[1])
+        end_date = date_prepare(req_dates[2])
+        print(start_date,forecast_date,end_date)
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'input file name issue')
+        print('input file name issue :: ',e)
+        return
 
-                runtype = prepare_runtype(source)  ## if ENSEMBLE_DETERMINISTIC_FORECAST is source runtype is ENSEMBLE_DETERMINISTIC
-                print(runtype)
-                # source = 'IMD_FORECAST'
-                # runtype = prepare_runtype('ENSEMBLE_FORECAST')
-                # INPUT_FILE = '20230303_20230318_20230427_1679144521408.zip'
-                INPUT_FILE = INPUT_PATH.split('/')[-1]
-                INPUT_FOLDER_NAME = INPUT_FILE.split('.')[0]
+    if input_archive is not None:
+        cn_available = input_archive.exists(CURVE_NUMBER+'_'+str(req_dates[1]))
+    else:
+        cn_available = file_exists(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/'+CURVE_NUMBER+'_'+str(req_dates[1]))
+    if not cn_available: ##CN file copying to CN folder
+        print(CURVE_NUMBER+'_'+str(req_dates[1])," this Curve number file not available. ")
+        send_error_email('source is '+ str(source)+ ' and input file name '+str(INPUT_FOLDER_NAME),'Curve number file not exists')
+        response = requests.get(constants_dict['RESPONSE_API']+'/'+UUID+'/'+STATUS_FAILURE)
+        reset_model_state(constants_dict)
+        time.sleep(5)
+        return
+    elif input_archive is not None:    ##the CN file is read again at compute time, when the cached zip may already be evicted
+        with open(constants_dict['CN_DIR']+CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME,'wb') as cn_file:
+            cn_file.write(input_archive.read(CURVE_NUMBER+'_'+str(req_dates[1])))
+    else:
+        os.rename(CURVE_NUMBER+'_'+str(req_dates[1]) , CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME)
+        shutil.move(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/'+CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME , constants_dict['CN_DIR']+CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME)
+    
+    pipeline_metrics.stage('rainfall_grid')
+    python_dss_writer = constants_dict.get('RAINFALL_DSS_WRITER','vortex') == 'python'
+    input_grid_data = input_archive if input_archive is not None else constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/'
+    try:
+        if python_dss_writer:    ##writing rainfall dss file directly, skips the NC file and the vortex import
+            rainfall_dss_prepare(constants_dict,req_dates[0],req_dates[2],input_grid_data,INPUT_FOLDER_NAME,run_spec_dict.get(runtype),runtype)
+        else:
+            nc_file_prepare(constants_dict,req_dates[0],req_dates[2],input_grid_data,INPUT_FOLDER_NAME,runtype)
+    except Exception as e:             ##preparing NC file
+        send_error_email(e,source + ' :: '+'error when creating NC file ')
+        print ("error when creating NC file ", e)
+        response = requests.get(constants_dict['RESPONSE_API']+'/'+UUID+'/'+STATUS_FAILURE)
+        reset_model_state(constants_dict)
+        time.sleep(5)
+        return
+
+    ens_member_dss = {}
+    if runtype == 'ENSEMBLE_FORECAST' and constants_dict.get('ENS_MEMBER_RUNS','false') == 'true':
+        try:    ##member rainfall dss files are only written in process, the vortex import reads one NC file per task
+            if not python_dss_writer:
+                raise Exception('ENS_MEMBER_RUNS needs RAINFALL_DSS_WRITER python')
+            ens_member_dss = prepare_ensemble_members(constants_dict,req_dates[0],req_dates[2],input_grid_data,INPUT_FOLDER_NAME,run_spec_dict.get(runtype))
+            print('ensemble members :: ',len(ens_member_dss))
+        except Exception as e:
+            send_error_email(e,source + ' :: '+'error preparing ensemble member rainfall')
+            print('error preparing ensemble member rainfall :: ',e)
+            ens_member_dss = {}
+
+    try:
+        dss_file_type = forecast_compute_dict.get(runtype)
+        dss_file_name = run_spec_dict.get(runtype)
+        creating_metadatafile(INPUT_FOLDER_NAME,dss_file_type,dss_file_name,constants_dict)  ##creating metadata file
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'error creating metadata file')
+        print("error creating metadata file",e)
+        return
+
+    rainfall_records = None
+    if python_dss_writer and rainfall_dss_reuse(constants_dict,runtype):    ##written into the shared rainfall dss when the task computes
+        rainfall_records = constants_dict['DSS_FILE_PATH']+INPUT_FOLDER_NAME+'/'+dss_file_name+'.npz'
+
+    pipeline_metrics.stage('rainfall_dss_import')
+    try:
+        if not python_dss_writer:
+            run_hms_script(constants_dict,constants_dict['DSS_FILE_CREATE_SCRIPT_PATH']) ##calling rainfall DSS file creation script
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'error creating input rainfall dss file')
+        print(e)
+        return
+
+    pipeline_metrics.stage('observed_parse')
+    try:
+        dss_file_name = run_spec_dict.get(runtype)  ##parsing observed data according to stations
+        missing_data_status = realtime_data_parse(constants_dict,obs_file)
+        print('missing_data_status',missing_data_status)
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'error parsing observed flows')
+        print(e)
+        return
+
+    pipeline_metrics.stage('observed_dss')
+    try:
+        observed_flows_data_prep(constants_dict) ##preparing observed blending dss data files
+    except Exception as e: 
+        send_error_email(e,source + ' :: '+'observed flows creation error')
+        print('observed flows creation error ::',e)
+        return
+
+    return {'runtype':runtype,'input_folder':INPUT_FOLDER_NAME,'req_dates':req_dates,'start_date':start_date,'forecast_date':forecast_date,
+            'end_date':end_date,'dss_file_name':dss_file_name,'missing_data_status':missing_data_status,'ens_member_dss':ens_member_dss,
+            'rainfall_records':rainfall_records}
+
+def compute_task(constants_dict,task,prepared):
+    ##tasks using the shared rainfall dss of their source hold it while hms computes from it, other tasks of the source wait to update it
+    if not prepared.get('rainfall_records'):
+        return compute_with_model_copies(constants_dict,task,prepared)
+    rainfall_dss = ExitStack()
+    try:
+        pipeline_metrics.stage('rainfall_dss_update')
+        shared_dss_path = rainfall_dss.enter_context(shared_rainfall_dss(constants_dict,prepared['runtype'],prepared['dss_file_name'],prepared['rainfall_records']))
+    except Exception as e:
+        send_error_email(e,task['source'] + ' :: '+'error updating shared rainfall dss')
+        print('error updating shared rainfall dss :: ',e)
+        reset_model_state(constants_dict)
+        return
+    release_rainfall_dss = run_once(rainfall_dss.close)
+    try:
+        return compute_with_model_copies(constants_dict,task,prepared,shared_dss_path,release_rainfall_dss)
+    finally:
+        release_rainfall_dss()    ##tasks that stopped before computing, the model copies are released by then
+
+def run_once(action):
+    ##action runs on the first call only, from whichever thread makes it
+    lock = threading.Lock()
+    done = []
+    def once():
+        with lock:
+            if not done:
+                done.append(True)
+                action()
+    return once
+
+def release_when_done(futures,release):
+    wait(futures)
+    release()
+
+def compute_with_model_copies(constants_dict,task,prepared,shared_dss_path=None,release_rainfall_dss=None):
+    ##model copies still read the shared rainfall dss, they are released before its lock is
+    model_copies = []
+    try:
+        return compute_prepared_task(constants_dict,task,prepared,model_copies,shared_dss_path,release_rainfall_dss)
+    finally:
+        release_model_copies(model_copies)
+
+def compute_prepared_task(constants_dict,task,prepared,model_copies,shared_dss_path=None,release_rainfall_dss=None):
+    ##model file edits, hms compute, output extraction and upload of a prepared task
+    UUID = task[UUID_STRING]
+    FC_OUTPUT_PATH = task[FC_OUTPUT_PATH_STRING]
+    SC_OUTPUT_PATH = task[SC_OUTPUT_PATH_STRING]
+    source = task['source']
+    runtype = prepared['runtype']
+    INPUT_FOLDER_NAME = prepared['input_folder']
+    req_dates = prepared['req_dates']
+    start_date = prepared['start_date']
+    forecast_date = prepared['forecast_date']
+    end_date = prepared['end_date']
+    dss_file_name = prepared['dss_file_name']
+    missing_data_status = prepared['missing_data_status']
+    ens_member_dss = prepared.get('ens_member_dss',{})
+    if ens_member_dss:    ##member rainfall dss files made while preparing the task, removed however the task ends
+        model_copies.append(({},[constants_dict['DSS_FILE_PATH']+INPUT_FOLDER_NAME+'_members/']))
+
+    pipeline_metrics.stage('model_files')
+    try:    
+        use_run_spec = missing_data_status and constants_dict.get('RUN_SPEC_ON_MISSING_DATA','false') == 'true'
+        file, model_run_type = get_file_fromstatus(use_run_spec,runtype) ##copying rainfall dss file to model folder
+        print(file,model_run_type)
+        if shared_dss_path is not None:    ##the grid file reads the shared rainfall dss of the source, nothing is copied
+            point_grid_dss(constants_dict['GRID_FILE_PATH'],shared_dss_path)
+        else:
+            shutil.copy(constants_dict['DSS_FILE_PATH']+INPUT_FOLDER_NAME+'/'+dss_file_name+'.dss', constants_dict['MODEL_INPUT_DSS_PATH'])
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'dss file copy error')
+        print('dss file copy error :: ' ,e)
+        return
+
+    model_snapshot = None
+    simulation_start_date = start_date
+    if constants_dict.get('WARM_START','false') == 'true':
+        try:    ##start from the state saved by an earlier task instead of spinning up from start_date again
+            simulation_start_date,model_snapshot = warm_start(constants_dict,runtype,file,start_date,forecast_date)
+        except Exception as e:
+            send_error_email(e,source + ' :: '+'warm start error, running from start date')
+            print('warm start error, running from start date :: ',e)
+
+    try:
+        forecast_file(constants_dict,file,simulation_start_date,forecast_date,end_date) ##making changes to forecast file
+    except Exception as e: ##TODO copy file if error occurs
+        send_error_email(e,source + ' :: '+'forecast file parsing exception')
+        print('forecast file parsing exception :: ',e)
+        return
+    
+    try:
+        grid_file(constants_dict,start_date,end_date) ##making changes to grid file
+    except Exception as e:   ##TODO copy file if error occurs 
+        send_error_email(e,source + ' :: '+'grid file parsing exception')
+        print('grid file parsing exception :: ',e)
+        return
+
+    # try:
+    #     if runtype != 'ENSEMBLE_FORECAST':  ##making changes to basin file by modifying the CN values for subbasins
+    #         basin_file(constants_dict,constants_dict['CN_DIR']+CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME,constants_dict['BASIN_FILE_PATH'])
+    #     else:
+    #         basin_file(constants_dict,constants_dict['CN_DIR']+CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME,constants_dict['VIRGIN_BASIN_FILE_PATH'])
+    # except Exception as e:    ##TODO copy file if error occurs
+    #     send_error_email(e,source + ' :: '+'basin file parsing exception')
+    #     print('basin file parsing exception :: ',e)
+    #     return
+    
+    try:
+        os.remove(constants_dict['GAGE_FILE_PATH']) ##making changes to gage file
+        shutil.copyfile(constants_dict['BACKUP_FOLDER']+constants_dict['GAGE_FILE_SRC'] , constants_dict['MODEL_PATH']+constants_dict['GAGE_FILE_SRC'])
+        relocate_project_file(constants_dict,constants_dict['MODEL_PATH']+constants_dict['GAGE_FILE_SRC'])
+        gage_file(constants_dict,start_date,forecast_date,end_date) 
+    except Exception as e:   ##TODO copy file if error occurs
+        send_error_email(e,source + ' :: '+'gage file parsing exception')
+        print('gage file parsing exception :: ',e)
+        return
+
+    try:
+        forecast_dss = FORECAST_OP_DSS.get(runtype) ##copying output empty dss file before running model
+        print('copying  --- '+forecast_dss)
+        os.remove(constants_dict['MODEL_PATH']+forecast_dss)
+        shutil.copyfile(constants_dict['BACKUP_FOLDER']+forecast_dss , constants_dict['MODEL_PATH']+forecast_dss)
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'error copying' + forecast_dss + ' dss file')
+        print('error copying' + forecast_dss + ' dss file :: ',e)
+        return
+
+    pipeline_metrics.stage('cn_scenarios_prepare')
+    cn_scenarios = {}
+    cn_futures = {}
+    if constants_dict.get('CN_SCENARIO_RUNS','false') == 'true':
+        model_copies.append((cn_futures,[model_copy_root(constants_dict,INPUT_FOLDER_NAME,'cn_scenarios')]))
+        try:    ##curve number scenarios compute next to the main run from the same rainfall dss
+            cn_scenarios = prepare_cn_scenarios(constants_dict,runtype,constants_dict['CN_DIR']+CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME,INPUT_FOLDER_NAME,
+                                                shared_dss_path or constants_dict['MODEL_INPUT_DSS_PATH'].rstrip('/')+'/'+dss_file_name+'.dss')
+            cn_futures.update(start_model_copies(cn_scenarios))
+        except Exception as e:
+            send_error_email(e,source + ' :: '+'error preparing curve number scenarios')
+            print('error preparing curve number scenarios :: ',e)
+            cn_scenarios = {}
+
+    pipeline_metrics.stage('ens_members_prepare')
+    ens_members = {}
+    ens_futures = {}
+    if ens_member_dss:
+        model_copies.append((ens_futures,[model_copy_root(constants_dict,INPUT_FOLDER_NAME,'ens_members')]))
+        try:    ##ensemble members compute next to the ensemble mean run, ENS_MEMBER_WORKERS jvms at a time
+            ens_members = prepare_ensemble_copies(constants_dict,ens_member_dss,INPUT_FOLDER_NAME)
+            ens_futures.update(start_model_copies(ens_members,int(constants_dict.get('ENS_MEMBER_WORKERS',max((os.cpu_count() or 2)//2,1)))))
+        except Exception as e:
+            send_error_email(e,source + ' :: '+'error preparing ensemble member runs')
+            print('error preparing ensemble member runs :: ',e)
+            ens_members = {}
+
+    pipeline_metrics.stage('compute')
+    try:
+        return_type = run_hms_compute(constants_dict,forecast_compute_dict.get(runtype))   #running forecast spcification for model
+        print('return-type :::   ',return_type)
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'HMS run execution error')
+        print('HMS run execution error :: ',e)
+        print('sleeping 20 sec')
+        time.sleep(20)
+        return
+
+    if release_rainfall_dss is not None:
+        ##the shared rainfall dss is released once the model copies computing from it are done too, not after the upload
+        copy_futures = [future for futures,paths in model_copies for future in futures.values()]
+        threading.Thread(target=release_when_done,args=(copy_futures,release_rainfall_dss),daemon=True).start()
+
+    if model_snapshot is not None:
+        try:
+            save_warm_state(constants_dict,runtype,forecast_date,model_snapshot)
+        except Exception as e:
+            send_error_email(e,source + ' :: '+'error saving model state')
+            print('error saving model state :: ',e)
+    
+    pipeline_metrics.stage('fc_extract')
+    python_extractor = constants_dict.get('OUTPUT_EXTRACTOR','jython') == 'python'
+    fc_df = None
+    sc_df = None
+    try:
+        if python_extractor:    ##full and self catchment flows read in this process with pydsstools, no script launch
+            fc_df,sc_df = extract_forecast_outputs(constants_dict,INPUT_FOLDER_NAME,forecast_compute_dict.get(runtype),simulation_start_date,end_date)
+        else:
+            run_hms_script(constants_dict,constants_dict['DSSSCRIPT_FILE_PATH'])  ##extracting full catchment out[ut]
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'error extracting full catchment output')
+        print('error extracting full catchment output :: ',e)
+        return
 
-                try:
-                    if os.path.exists(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/'):  ##if INPUT_GRID_DIR folder exisits delete the path
-                        shutil.rmtree(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/')
-                except Exception as e:
-                    send_error_email(e,source + ' :: '+'error removing ' + constants_dict['INPUT_GRID_DIR']+ 'path')
-                    print('error removing ' + constants_dict['INPUT_GRID_DIR']+ 'path',e)
-                    continue
+    if constants_dict.get('COLUMNAR_OUTPUT','false') == 'true':
+        try:
+            fc_output_file = constants_dict['FINAL_OUT_PATH']+FC_OUTPUT+'/'+INPUT_FOLDER_NAME
+            if fc_df is None:
+                fc_df = pd.read_csv(fc_output_file,header=None,index_col=False,names=SC_HEADER_NAMES)
+            write_columnar_output(fc_df,fc_output_file)
+        except Exception as e:
+            send_error_email(e,source + ' :: '+'error writing full catchment parquet output')
+            print('error writing full catchment parquet output :: ',e)
+
+    pipeline_metrics.stage('sc_extract')
+    try:
+        if not python_extractor:
+            run_hms_script(constants_dict,constants_dict['SC_DSSSCRIPT_FILE_PATH'])  ##extracting self catchment output
+        pipeline_metrics.stage('sc_merge')
+        sc_merge(constants_dict,INPUT_FOLDER_NAME,sc_df)
+    except Exception as e:
+        send_error_email(e,source + ' :: '+'error extracting self catchment output')
+        print('error extracting self catchment output :: ',e)
+        return
+    
+    pipeline_metrics.stage('cn_scenarios_output')
+    if cn_scenarios:
+        try:
+            cn_scenario_outputs(constants_dict,cn_scenarios,cn_futures,INPUT_FOLDER_NAME)
+        except Exception as e:
+            send_error_email(e,source + ' :: '+'error writing curve number scenario output')
+            print('error writing curve number scenario output :: ',e)
 
-                try:
-                    with ZipFile(constants_dict['INPUT_GRID_DIR']+INPUT_FILE, 'r') as zipObj:  ##unziping input data
-                        zipObj.extractall(constants_dict['INPUT_GRID_DIR'])
-                except Exception as e:
-                    send_error_email(source + ' :: '+str(e),'unzip error of grid data ' + constants_dict['INPUT_GRID_DIR'])
-                    print('unzippiing error :: ',e)
-                    continue
-                
-                try:
-                    os.chdir(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/')  #copying observed data from input data to observed data folder 
-                    os.rename(OBSERVED_DATA , OBSERVED_DATA+'_'+INPUT_FOLDER_NAME)
-                    shutil.move(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/'+OBSERVED_DATA+'_'+INPUT_FOLDER_NAME , constants_dict['OBS_FLOWS_DIR']+OBSERVED_DATA+'_'+INPUT_FOLDER_NAME)
-                except Exception as e:
-                    send_error_email(e,source + ' :: '+'error copying observed flows file '+ OBSERVED_DATA+'_'+INPUT_FOLDER_NAME)
-                    print('error copying observed flows file '+ OBSERVED_DATA+'_'+INPUT_FOLDER_NAME + ' :: ',e )
-                    continue
-                
-                try:
-                    req_dates = INPUT_FOLDER_NAME.split('_')  ##getting simulation dates from input folder name
-                    start_date = date_prepare(req_dates[0])
-                    # start_date = datetime.date(int(2022),int(5),int(2))
-                    forecast_date = date_prepare(req_dates[1])
-                    end_date = date_prepare(req_dates[2])
-                    print(start_date,forecast_date,end_date)
-                except Exception as e:
-                    send_error_email(e,source + ' :: '+'input file name issue')
-                    print('input file name issue :: ',e)
-                    continue
+    pipeline_metrics.stage('ens_members_output')
+    ens_output_files = []
+    if ens_members:
+        try:
+            ens_output_files = ensemble_percentile_outputs(constants_dict,ens_members,ens_futures,INPUT_FOLDER_NAME)
+        except Exception as e:
+            send_error_email(e,source + ' :: '+'error writing ensemble percentile output')
+            print('error writing ensemble percentile output :: ',e)
+
+    # time.sleep(5000)
+
+    pipeline_metrics.stage('upload')
+    ##uploading self and full catchment data at the same time, failed uploads are retried inside the transfer
+    uploads = [(constants_dict['FINAL_OUT_PATH']+FC_OUTPUT+'/'+INPUT_FOLDER_NAME,FC_OUTPUT_PATH),
+               (constants_dict['FINAL_OUT_PATH']+SC_OUTPUT+'/'+INPUT_FOLDER_NAME,SC_OUTPUT_PATH)]
+    if constants_dict.get('COLUMNAR_OUTPUT','false') == 'true':
+        for out_dir,server_path in [(FC_OUTPUT,FC_OUTPUT_PATH),(SC_OUTPUT,SC_OUTPUT_PATH)]:
+            if os.path.exists(constants_dict['FINAL_OUT_PATH']+out_dir+'/'+INPUT_FOLDER_NAME+COLUMNAR_SUFFIX):
+                uploads.append((constants_dict['FINAL_OUT_PATH']+out_dir+'/'+INPUT_FOLDER_NAME+COLUMNAR_SUFFIX,columnar_server_path(server_path)))
+    for output_file in ens_output_files:
+        uploads.append((constants_dict['FINAL_OUT_PATH']+FC_OUTPUT+'/'+output_file,ensemble_server_path(FC_OUTPUT_PATH,output_file[len(INPUT_FOLDER_NAME):])))
+    upload_status = get_transfer(constants_dict).upload_many(uploads)
+    FC_file_upload_status = 0 if upload_status[0] else 1
+    SC_file_upload_status = 0 if upload_status[1] else 1
+
+    pipeline_metrics.stage('acknowledge')
+    ## based on error code handling the response for input request
+    if (FC_file_upload_status == 1 or SC_file_upload_status == 1):
+        response = requests.get(constants_dict['RESPONSE_API']+'/'+UUID+'/'+STATUS_FAILURE)   
+    else:
+        try:
+            response = requests.get(constants_dict['RESPONSE_API']+'/'+UUID+'/'+STATUS_SUCCESS)
+            if response.status_code == 200:
+                logging.info("API response :: %s",str(response.text))
+            elif response.status_code != 200:
+                for i in range(3):
+                    time.sleep(30)
+                    response = requests.get(constants_dict['RESPONSE_API']+'/'+UUID+'/'+STATUS_SUCCESS)
+                    if response.status_code != 200:
+                        continue
+                    else:
+                        break
+        except Exception as e:
+            send_error_email(e,source + ' :: '+'error upon acknowledging the success status')
+            print('error upon acknowledging the success status',e)
+            reset_model_state(constants_dict)
+            return
+    
+    #after model run is done prepaing for file structure for next run
+    reset_model_state(constants_dict)
+    return FC_file_upload_status == 0 and SC_file_upload_status == 0
 
-                if not file_exists(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/'+CURVE_NUMBER+'_'+str(req_dates[1])): ##CN file copying to CN folder
-                    print(CURVE_NUMBER+'_'+str(req_dates[1])," this Curve number file not available. ")
-                    send_error_email('source is '+ str(source)+ ' and input file name '+str(INPUT_FOLDER_NAME),'Curve number file not exists')
-                    response = requests.get(constants_dict['RESPONSE_API']+'/'+UUID+'/'+STATUS_FAILURE)
-                    delete_extract_dir()
-                
-                    os.chdir(constants_dict['OBS_DSS_DIR'])
-                    filelist = os.listdir('.')
-                    for f in filelist:
-                        os.remove(os.path.join(constants_dict['OBS_DSS_DIR'], f))
-                    time.sleep(5)
-                    continue
-                else:
-                    os.rename(CURVE_NUMBER+'_'+str(req_dates[1]) , CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME)
-                    shutil.move(constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/'+CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME , constants_dict['CN_DIR']+CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME)
-                
-                try:
-                    nc_file_prepare(constants_dict,req_dates[0],req_dates[2],constants_dict['INPUT_GRID_DIR']+INPUT_FOLDER_NAME+'/',INPUT_FOLDER_NAME)
-                except Exception as e:             ##preparing NC file
-                    send_error_email(e,source + ' :: '+'error when creating NC file ')
-                    print ("error when creating NC file ", e)
-                    response = requests.get(constants_dict['RESPONSE_API']+'/'+UUID+'/'+STATUS_FAILURE)
-                    delete_extract_dir(constants_dict)
-                
-                    os.chdir(constants_dict['OBS_DSS_DIR'])
-                    filelist = os.listdir('.')
-                    for f in filelist:
-                        os.remove(os.path.join(constants_dict['OBS_DSS_DIR'], f))
-                    time.sleep(5)
-                    continue                  
+def run_isolated_task(constants_dict,task):
+    try:
+        try:
+            task_constants = create_task_workspace(constants_dict,task[UUID_STRING])
+        except Exception as e:
+            send_error_email(e,task['source'] + ' :: '+'error creating task workspace')
+            print('error creating task workspace :: ',e)
+            return
+        try:
+            run_task(task_constants,task)
+        finally:
+            shutil.rmtree(task_constants['WORKSPACE'],ignore_errors=True)
+    except Exception as e:
+        send_error_email(e,'code execution error')
+        print("code execution error",e)
 
-                try:
-                    dss_file_type = forecast_compute_dict.get(runtype)
-                    dss_file_name = run_spec_dict.get(runtype)
-                    creating_metadatafile(INPUT_FOLDER_NAME,dss_file_type,dss_file_name,constants_dict)  ##creating metadata file
-                except Exception as e:
-                    send_error_email(e,source + ' :: '+'error creating metadata file')
-                    print("error creating metadata file",e)
-                    continue
+def prepare_isolated_task(constants_dict,task):
+    ##runs in the intake process, returns the task workspace constants and the prepared inputs, or None
+    try:
+        task_constants = create_task_workspace(constants_dict,task[UUID_STRING])
+    except Exception as e:
+        send_error_email(e,task['source'] + ' :: '+'error creating task workspace')
+        print('error creating task workspace :: ',e)
+        return None
+    try:
+        with pipeline_metrics.trace_task(constants_dict.get('METRICS_DIR'),task[UUID_STRING],task['source'],'prepare') as trace:
+            prepared = prepare_task(task_constants,task)
+            if trace is not None and prepared is None:
+                trace.status = 'failed'
+    except Exception as e:
+        send_error_email(e,'code execution error')
+        print("code execution error",e)
+        prepared = None
+    if prepared is None:
+        shutil.rmtree(task_constants['WORKSPACE'],ignore_errors=True)
+        return None
+    return task_constants,prepared
+
+def compute_isolated_task(task_constants,task,prepared):
+    try:
+        with pipeline_metrics.trace_task(task_constants.get('METRICS_DIR'),task[UUID_STRING],task['source'],'compute') as trace:
+            if not compute_task(task_constants,task,prepared) and trace is not None:
+                trace.status = 'failed'
+    except Exception as e:
+        send_error_email(e,'code execution error')
+        print("code execution error",e)
+    finally:
+        shutil.rmtree(task_constants['WORKSPACE'],ignore_errors=True)
+
+async def intake_stage(queue,prefetch_slots):
+    ##claims and prepares the next task while the compute stage runs the current one.
+    ##preparing runs in its own process, it changes the working directory and may start its own hms jvm
+    loop = asyncio.get_running_loop()
+    prepare_executor = ProcessPoolExecutor(max_workers=1)
+    backoff = None
+    while True:
+        await prefetch_slots.acquire()
+        task = None
+        while task is None:
+            try:
+                constants_dict = load_constants()
+            except Exception as e:
+                send_error_email(e,'constant file importing error')
+                print("invalid constant file :: ",e)
+                await asyncio.sleep(60)
+                continue
+            if backoff is None:
+                backoff = PollBackoff(constants_dict)
+            task = await loop.run_in_executor(None,request_task,constants_dict,backoff)
+            if task is None:
+                await asyncio.sleep(backoff.wait)
+        logging.info('task %s claimed, preparing',task[UUID_STRING])
 
-                try:
-                    os.chdir(constants_dict['HMS_DIR_PATH'])
-                    os.system("./hec-hms.sh -script " + constants_dict['DSS_FILE_CREATE_SCRIPT_PATH']) ##calling rainfall DSS file creation script
-                except Exception as e:
-                    send_error_email(e,source + ' :: '+'error creating input rainfall dss file')
-                    print(e)
-                    continue
+        try:
+            prepared = await loop.run_in_executor(prepare_executor,prepare_isolated_task,constants_dict,task)
+        except Exception as e:
+            send_error_email(e,task['source'] + ' :: '+'task preparation error')
+            print('task preparation error :: ',e)
+            prepared = None
+            if isinstance(e,BrokenProcessPool):
+                prepare_executor = ProcessPoolExecutor(max_workers=1)
+        if prepared is None:
+            prefetch_slots.release()
+            continue
+        task_constants,task_inputs = prepared
+        await queue.put((task_constants,task,task_inputs))
+
+async def compute_stage(queue,prefetch_slots):
+    ##one hms compute at a time, the next prepared task is already waiting in the queue when this one finishes
+    loop = asyncio.get_running_loop()
+    compute_executor = ThreadPoolExecutor(max_workers=1)
+    while True:
+        task_constants,task,task_inputs = await queue.get()
+        prefetch_slots.release()
+        logging.info('task %s computing',task[UUID_STRING])
+        await loop.run_in_executor(compute_executor,compute_isolated_task,task_constants,task,task_inputs)
+
+async def run_pipeline(prefetch):
+    queue = asyncio.Queue()
+    prefetch_slots = asyncio.Semaphore(prefetch)
+    await asyncio.gather(intake_stage(queue,prefetch_slots),compute_stage(queue,prefetch_slots))
+
+def run_worker_pool(pool_size):
+    ##claims up to pool_size tasks at once, each task runs in its own process and workspace
+    running = set()
+    with ProcessPoolExecutor(max_workers=pool_size) as executor:
+        while(True):
+            try:
+                if len(running) >= pool_size:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
 
                 try:
-                    dss_file_name = run_spec_dict.get(runtype)  ##parsing observed data according to stations
-                    missing_data_status = realtime_data_parse(constants_dict,OBSERVED_DATA+'_'+INPUT_FOLDER_NAME)
-                    print('missing_data_status',missing_data_status)
+                    constants_dict = load_constants()
                 except Exception as e:
-                    send_error_email(e,source + ' :: '+'error parsing observed flows')
-                    print(e)
-                    continue
-
-                try:
-                    observed_flows_data_prep(constants_dict) ##preparing observed blending dss data files
-                except Exception as e: 
-                    send_error_email(e,source + ' :: '+'observed flows creation error')
-                    print('observed flows creation error ::',e)
+                    send_error_email(e,'constant file importing error')
+                    print("invalid constant file :: ",e)
                     continue
 
-                try:    
-                    file, model_run_type = get_file_fromstatus(missing_data_status,runtype) ##copying rainfall dss file to model folder
-                    print(file,model_run_type)
-                    shutil.copy(constants_dict['DSS_FILE_PATH']+INPUT_FOLDER_NAME+'/'+dss_file_name+'.dss', constants_dict['MODEL_INPUT_DSS_PATH'])
-                except Exception as e:
-                    send_error_email(e,source + ' :: '+'dss file copy error')
-                    print('dss file copy error :: ' ,e)
+                task = request_task(constants_dict)
+                if task is None:
                     continue
+                running.add(executor.submit(run_isolated_task,constants_dict,task))
+                logging.info('task %s submitted, %d running',task[UUID_STRING],len(running))
 
-                try:
-                    forecast_file(constants_dict,file,start_date,forecast_date,end_date) ##making changes to forecast file
-                except Exception as e: ##TODO copy file if error occurs
-                    send_error_email(e,source + ' :: '+'forecast file parsing exception')
-                    print('forecast file parsing exception :: ',e)
-                    continue
-                
-                try:
-                    grid_file(constants_dict,start_date,end_date) ##making changes to grid file
-                except Exception as e:   ##TODO copy file if error occurs 
-                    send_error_email(e,source + ' :: '+'grid file parsing exception')
-                    print('grid file parsing exception :: ',e)
-                    continue
+            except Exception as e:
+                send_error_email(e,'code execution error')
+                print("code execution error",e)
+                continue
 
-                # try:
-                #     if runtype != 'ENSEMBLE_FORECAST':  ##making changes to basin file by modifying the CN values for subbasins
-                #         basin_file(constants_dict,constants_dict['CN_DIR']+CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME,constants_dict['BASIN_FILE_PATH'])
-                #     else:
-                #         basin_file(constants_dict,constants_dict['CN_DIR']+CURVE_NUMBER+'_'+str(req_dates[1])+'_'+INPUT_FOLDER_NAME,constants_dict['VIRGIN_BASIN_FILE_PATH'])
-                # except Exception as e:    ##TODO copy file if error occurs
-                #     send_error_email(e,source + ' :: '+'basin file parsing exception')
-                #     print('basin file parsing exception :: ',e)
-                #     continue
-                
-                try:
-                    os.remove(constants_dict['GAGE_FILE_PATH']) ##making changes to gage file
-                    shutil.copyfile(constants_dict['BACKUP_FOLDER']+constants_dict['GAGE_FILE_SRC'] , constants_dict['MODEL_PATH']+constants_dict['GAGE_FILE_SRC'])
-                    gage_file(constants_dict,start_date,forecast_date,end_date) 
-                except Exception as e:   ##TODO copy file if error occurs
-                    send_error_email(e,source + ' :: '+'gage file parsing exception')
-                    print('gage file parsing exception :: ',e)
-                    continue
+def main():   ##TODO upon exception extracting data from backup folder.
+    try:
+        startup_constants = load_constants()
+    except Exception as e:
+        startup_constants = {}
+    try:
+        pool_size = int(startup_constants.get('WORKER_POOL_SIZE',1))
+    except Exception as e:
+        pool_size = 1
+    try:
+        prefetch = int(startup_constants.get('PIPELINE_PREFETCH',0))
+    except Exception as e:
+        prefetch = 0
+    if (pool_size > 1 or prefetch > 0) and startup_constants.get('OUTPUT_EXTRACTOR','jython') != 'python':
+        ##the self catchment jython script reads the global constants file and not the task workspace copy,
+        ##so tasks in their own workspaces have to extract in process
+        print('WORKER_POOL_SIZE above 1 and PIPELINE_PREFETCH need OUTPUT_EXTRACTOR python, not starting')
+        return
+    if pool_size > 1:
+        run_worker_pool(pool_size)
+        return
+    if prefetch > 0:
+        asyncio.run(run_pipeline(prefetch))
+        return
 
-                try:
-                    forecast_dss = FORECAST_OP_DSS.get(runtype) ##copying output empty dss file before running model
-                    print('copying  --- '+forecast_dss)
-                    os.remove(constants_dict['MODEL_PATH']+forecast_dss)
-                    shutil.copyfile(constants_dict['BACKUP_FOLDER']+forecast_dss , constants_dict['MODEL_PATH']+forecast_dss)
+    while(True):
+        try:
+            try:
+                try:                
+                    constants_dict = load_constants()
                 except Exception as e:
-                    send_error_email(e,source + ' :: '+'error copying' + forecast_dss + ' dss file')
-                    print('error copying' + forecast_dss + ' dss file :: ',e)
+                    send_error_email(e,'constant file importing error')
+                    print("invalid constant file :: ",e)
                     continue
 
-                try:
-                    os.chdir(constants_dict['HMS_DIR_PATH'])   #running forecast spcification for model
-                    return_type = os.system("./hec-hms.sh -script " + constants_dict['FORECAST_SCRIPT_FILE_PATH'])
-                    print('return-type :::   ',return_type)
-                except Exception as e:
-                    send_error_email(e,source + ' :: '+'HMS run execution error')
-                    print('HMS run execution error :: ',e)
-                    print('sleeping 20 sec')
-                    time.sleep(20)
+                task = request_task(constants_dict)
+                if task is None:
                     continue
-                
-                try:
-                    os.system("./hec-hms.sh -script " + constants_dict['DSSSCRIPT_FILE_PATH'])  ##extracting full catchment out[ut]
-                except Exception as e:
-                    send_error_email(e,source + ' :: '+'error extracting full catchment output')
-                    print('error extracting full catchment output :: ',e)
-                    continue            
 
-                try:
-                    os.system("./hec-hms.sh -script " + constants_dict['SC_DSSSCRIPT_FILE_PATH'])  ##extracting self catchment output
-                    sc_merge(constants_dict,INPUT_FOLDER_NAME)
-                except Exception as e:
-                    send_error_email(e,source + ' :: '+'error extracting self catchment output')
-                    print('error extracting self catchment output :: ',e)
-                    continue
-                
-                # time.sleep(5000)
-
-                ##uploading self and full catchment data
-                FC_file_upload_status = server_file_upload(constants_dict,constants_dict['FINAL_OUT_PATH']+FC_OUTPUT+'/',INPUT_FOLDER_NAME,FC_OUTPUT_PATH)
-                SC_file_upload_status = server_file_upload(constants_dict,constants_dict['FINAL_OUT_PATH']+SC_OUTPUT+'/',INPUT_FOLDER_NAME,SC_OUTPUT_PATH)
-                
-
-
-                ##if file is not uploaded trying to reupload
-                if (FC_file_upload_status != 0):
-                    for i in range(3):
-                        FC_file_upload_status = server_file_upload(constants_dict,constants_dict['FINAL_OUT_PATH']+FC_OUTPUT+'/',INPUT_FOLDER_NAME,FC_OUTPUT_PATH)
-                        if FC_file_upload_status == 1:
-                            continue
-                        else:
-                            FC_file_upload_status = 0
-                            break
-                elif(SC_file_upload_status !=0):
-                    for i in range(3):
-                        SC_file_upload_status = server_file_upload(constants_dict,constants_dict['FINAL_OUT_PATH']+FC_OUTPUT+'/',INPUT_FOLDER_NAME,SC_OUTPUT_PATH)
-                        if SC_file_upload_status == 1:
-                            continue
-                        else:
-                            SC_file_upload_status = 0
-                            break
-                
-                ## based on error code handling the response for input request
-                if (FC_file_upload_status == 1 or SC_file_upload_status == 1):
-                    response = requests.get(constants_dict['RESPONSE_API']+'/'+UUID+'/'+STATUS_FAILURE)   
-                else:
-                    try:
-                        response = requests.get(constants_dict['RESPONSE_API']+'/'+UUID+'/'+STATUS_SUCCESS)
-                        if response.status_code == 200:
-                            logging.info("API response :: %s",str(response.text))
-                        elif response.status_code != 200:
-                            for i in range(3):
-                                time.sleep(30)
-                                response = requests.get(constants_dict['RESPONSE_API']+'/'+UUID+'/'+STATUS_SUCCESS)
-                                if response.status_code != 200:
-                                    continue
-                                else:
-                                    break
-                    except Exception as e:
-                        send_error_email(e,source + ' :: '+'error upon acknowledging the success status')
-                        print('error upon acknowledging the success status',e)
-                        delete_extract_dir()
-                        delete_obs_discharge(constants_dict)
-                        continue
-                
-                #after model run is done prepaing for file structure for next run
-                delete_extract_dir(constants_dict)
-                delete_obs_discharge(constants_dict)
+                run_task(constants_dict,task)
                 print('will sleep 5 sec and continue')
                 time.sleep(5)
                 continue
@@ -0,0 +1,175 @@
+import os
+from collections import OrderedDict
+
+# hms project files (.forecast, .grid, .gage, .basin, ...) are a list of blocks
+#   Kind: Name
+#        Field: value
+#        ...
+#   End:
+# parsed once into blocks keyed by (kind, name) with the line numbers of every field,
+# so edits replace single lines and the file is written back unchanged everywhere else.
+# added fields are appended after the last line and written before the End: line of their block, removed lines
+# are left as None, so line numbers never move and the file is only parsed again once, when it is saved
+
+# least recently loaded first, workspaces and model copies add new paths with every task
+parsed_files = OrderedDict()
+PARSED_FILES_LIMIT = 32
+
+def remember_parsed(path,entry):
+    parsed_files[path] = entry
+    parsed_files.move_to_end(path)
+    while len(parsed_files) > PARSED_FILES_LIMIT:
+        parsed_files.popitem(last=False)
+
+class HmsFile(object):
+    def __init__(self,path,lines,blocks,fields):
+        self.path = path
+        self.lines = lines
+        self.blocks = blocks    # (kind, name) -> [(start line, end line)]
+        self.fields = fields    # (kind, name) -> {field: [line numbers]}
+        self.parsed_length = len(lines)    # lines past this one were added by put_field
+        self.inserted = {}      # End: line -> [line numbers of added fields]
+        self.removed = False
+        self.owned = set()      # blocks whose field dict is no longer shared with parsed_files
+
+    def block_names(self,kind):
+        return [name for block_kind,name in self.blocks if block_kind == kind]
+
+    def matching_blocks(self,kind,name):
+        # kind or name None matches every block, a block named by both is looked up directly
+        if kind is not None and name is not None:
+            return [(kind,name)] if (kind,name) in self.fields else []
+        return [(block_kind,block_name) for block_kind,block_name in self.fields
+                if (kind is None or block_kind == kind) and (name is None or block_name == name)]
+
+    def field_lines(self,kind,name,field):
+        line_numbers = []
+        for block in self.matching_blocks(kind,name):
+            line_numbers.extend(self.fields[block].get(field,[]))
+        return line_numbers
+
+    def get_field(self,kind,name,field):
+        line_numbers = self.field_lines(kind,name,field)
+        if not line_numbers:
+            return None
+        return self.lines[line_numbers[-1]].split(':',1)[1].strip()
+
+    def set_field(self,kind,name,field,value,last_only=False):
+        # returns the number of lines changed, indentation and line ending are kept
+        changed = 0
+        for block in self.matching_blocks(kind,name):
+            line_numbers = self.fields[block].get(field,[])
+            if last_only:
+                line_numbers = line_numbers[-1:]
+            for i in line_numbers:
+                self.write_line(i,field,value)
+                changed += 1
+        return changed
+
+    def update_field(self,kind,name,field,update):
+        # like set_field, but every line gets update(its own value), a field repeated in a block keeps its own values
+        line_numbers = self.field_lines(kind,name,field)
+        for i in line_numbers:
+            self.write_line(i,field,update(self.lines[i].split(':',1)[1].strip()))
+        return len(line_numbers)
+
+    def write_line(self,i,field,value):
+        line = self.lines[i]
+        indent = line[:len(line)-len(line.lstrip())]
+        eol = '\r' if line.endswith('\r') else ''
+        self.lines[i] = indent+field+': '+str(value)+eol
+
+    def block_fields(self,block):
+        # copy of the block field dict before a field is added or removed, the parsed one stays shared
+        if block not in self.owned:
+            if not self.owned:
+                self.fields = dict(self.fields)
+            self.fields[block] = dict(self.fields.get(block,{}))
+            self.owned.add(block)
+        return self.fields[block]
+
+    def put_field(self,kind,name,field,value):
+        # like set_field, but a field the block does not have yet is added before its End: line
+        if self.set_field(kind,name,field,value):
+            return
+        start,end = self.blocks[(kind,name)][0]
+        field_lines = [i for i in range(start+1,end) if self.lines[i] is not None and self.lines[i].strip()]
+        indent = self.lines[field_lines[0]][:len(self.lines[field_lines[0]])-len(self.lines[field_lines[0]].lstrip())] if field_lines else '     '
+        eol = '\r' if self.lines[end].endswith('\r') else ''
+        self.lines.append(indent+field+': '+str(value)+eol)
+        self.inserted.setdefault(end,[]).append(len(self.lines)-1)
+        self.block_fields((kind,name))[field] = [len(self.lines)-1]
+
+    def remove_field(self,kind,name,field):
+        removed = 0
+        for block in self.matching_blocks(kind,name):
+            for i in self.fields[block].get(field,[]):
+                self.lines[i] = None
+                self.removed = True
+                removed += 1
+            if field in self.fields[block]:
+                del self.block_fields(block)[field]
+        return removed
+
+    def text_lines(self):
+        if not self.inserted and not self.removed:
+            return self.lines
+        ordered = []
+        for i,line in enumerate(self.lines[:self.parsed_length]):
+            ordered.extend(self.lines[j] for j in self.inserted.get(i,[]) if self.lines[j] is not None)
+            if line is not None:
+                ordered.append(line)
+        return ordered
+
+    def text(self):
+        return '\n'.join(self.text_lines())
+
+    def save(self,path=None):
+        # written through a temp file and renamed, so hms never sees a half written file
+        path = path or self.path
+        if self.inserted or self.removed:    # added and removed fields are parsed into place once
+            self.lines = self.text_lines()
+            self.blocks,self.fields = parse_lines(self.lines)
+            self.parsed_length = len(self.lines)
+            self.inserted = {}
+            self.removed = False
+            self.owned = set()
+        temp_path = path+'.'+str(os.getpid())+'.tmp'
+        with open(temp_path,'w',newline='') as hms_file:
+            hms_file.write(self.text())
+        os.replace(temp_path,path)
+        file_stat = os.stat(path)
+        remember_parsed(path,((file_stat.st_mtime_ns,file_stat.st_size),list(self.lines),self.blocks,self.fields))
+
+def parse_lines(lines):
+    blocks = {}
+    fields = {}
+    current = None
+    for i,line in enumerate(lines):
+        stripped = line.rstrip()
+        if current is None:
+            if stripped and not line[0].isspace() and ':' in stripped:
+                kind,name = stripped.split(':',1)
+                current = (kind.strip(),name.strip())
+                start = i
+                block_fields = fields.setdefault(current,{})
+        elif stripped == 'End:' and not line[0].isspace():
+            blocks.setdefault(current,[]).append((start,i))
+            current = None
+        elif ':' in stripped:
+            block_fields.setdefault(stripped.split(':',1)[0].strip(),[]).append(i)
+    return blocks,fields
+
+def load_hms_file(path):
+    # unchanged files are not parsed again, every caller gets its own copy of the lines to edit
+    file_stat = os.stat(path)
+    file_key = (file_stat.st_mtime_ns,file_stat.st_size)
+    if path in parsed_files and parsed_files[path][0] == file_key:
+        lines,blocks,fields = parsed_files[path][1:]
+        parsed_files.move_to_end(path)
+        return HmsFile(path,list(lines),blocks,fields)
+    with open(path,'r',newline='') as hms_file:
+        lines = hms_file.read().split('\n')
+    blocks,fields = parse_lines(lines)
+    remember_parsed(path,(file_key,list(lines),blocks,fields))
+    return HmsFile(path,lines,blocks,fields)
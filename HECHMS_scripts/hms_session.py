@@ -0,0 +1,86 @@
+from hms.model import Project
+from hms import Hms
+from hec.heclib.dss import HecDataManager
+import os
+import sys
+import json
+import traceback
+
+# long lived hms session, started once per worker with ./hec-hms.sh -script hms_session.py
+# reads one json command per line from stdin and answers with one REPLY_PREFIX line on stdout
+#   {"cmd": "compute", "project": <.hms file>, "forecast": <forecast name>}
+#   {"cmd": "script", "path": <jython script>, "constants": <constants.csv>}
+#   {"cmd": "close"}
+
+REPLY_PREFIX = 'HMS_SESSION_REPLY '
+PROJECT_EXTENSIONS = ('.hms','.basin','.met','.control','.gage','.grid','.forecast','.run')
+
+projects = {}
+
+def project_signature(project_file):
+    # projects are reopened only when one of their definition files changed on disk
+    project_dir = os.path.dirname(project_file)
+    signature = []
+    for name in sorted(os.listdir(project_dir)):
+        if name.endswith(PROJECT_EXTENSIONS):
+            signature.append((name,os.path.getmtime(os.path.join(project_dir,name))))
+    return signature
+
+def open_project(project_file):
+    for open_file in list(projects.keys()):
+        project,signature = projects[open_file]
+        if open_file == project_file and signature == project_signature(project_file):
+            return project
+        # one open project per session, task workspaces are thrown away after the task
+        project.close()
+        del projects[open_file]
+    project = Project.open(project_file)
+    projects[project_file] = (project,project_signature(project_file))
+    return project
+
+def compute(command):
+    project = open_project(command['project'])
+    project.computeForecast(command['forecast'])
+    # hms may save its own files while computing, remember them so the next task does not reopen for that
+    projects[command['project']] = (project,project_signature(command['project']))
+
+def run_script(command):
+    os.environ['HMS_CONSTANTS_FILE'] = command['constants']
+    try:
+        execfile(command['path'],{'__name__':'__main__'})
+    finally:
+        # dss files a script left open would stay open for the life of the session, one set per task
+        HecDataManager.closeAllFiles()
+
+def close():
+    for project,signature in projects.values():
+        project.close()
+    projects.clear()
+    Hms.shutdownEngine()
+
+def reply(status,message=''):
+    sys.stdout.write(REPLY_PREFIX + json.dumps({'status':status,'message':message}) + '\n')
+    sys.stdout.flush()
+
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        close()
+        break
+    if not line.strip():
+        continue
+    try:
+        command = json.loads(line)
+        if command['cmd'] == 'compute':
+            compute(command)
+        elif command['cmd'] == 'script':
+            run_script(command)
+        elif command['cmd'] == 'close':
+            close()
+            reply('ok')
+            break
+        else:
+            raise ValueError('unknown command ' + str(command['cmd']))
+        reply('ok')
+    except:
+        reply('error',traceback.format_exc())
@@ -0,0 +1,120 @@
+import os
+import copy
+import json
+import time
+import fcntl
+from contextlib import contextmanager
+from zipfile import ZipFile
+from transfer import file_sha256
+
+# downloaded task input zips, kept by content as <cache>/objects/<sha256>.zip.
+# index.json maps server paths to hashes and keeps the size and last use of every zip, least recently used
+# zips are removed once the cache is over its size limit. the index is only changed under an flock,
+# so worker processes and the intake process share one cache
+
+class InputCache(object):
+    def __init__(self,cache_dir,max_bytes,min_age=3600):
+        # zips used in the last min_age seconds are never evicted, a prepared task may still be reading them
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir,'objects')
+        self.index_path = os.path.join(cache_dir,'index.json')
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        os.makedirs(self.objects_dir,exist_ok=True)
+
+    def object_path(self,sha256):
+        return os.path.join(self.objects_dir,sha256+'.zip')
+
+    def download_dir(self):
+        # on the same filesystem as the objects, so a finished download is moved in with a rename
+        download_dir = os.path.join(self.cache_dir,'download',str(os.getpid()))+'/'
+        os.makedirs(download_dir,exist_ok=True)
+        return download_dir
+
+    @contextmanager
+    def locked_index(self):
+        with open(self.index_path+'.lock','a') as lock_file:
+            fcntl.flock(lock_file,fcntl.LOCK_EX)
+            try:
+                index = {'paths':{},'objects':{}}
+                if os.path.exists(self.index_path):
+                    with open(self.index_path) as index_file:
+                        index = json.load(index_file)
+                yield index
+                temp_path = self.index_path+'.'+str(os.getpid())+'.tmp'
+                with open(temp_path,'w') as index_file:
+                    json.dump(index,index_file)
+                os.replace(temp_path,self.index_path)
+            finally:
+                fcntl.flock(lock_file,fcntl.LOCK_UN)
+
+    def lookup(self,server_path,sha256):
+        # cached zip with that content. never looked up by server path alone, a re-issued zip may reuse the path
+        with self.locked_index() as index:
+            if sha256 not in index['objects'] or not os.path.exists(self.object_path(sha256)):
+                return None
+            index['objects'][sha256]['used'] = time.time()
+            index['paths'][server_path] = sha256
+            return self.object_path(sha256)
+
+    def store(self,server_path,downloaded_file):
+        sha256 = file_sha256(downloaded_file)
+        object_path = self.object_path(sha256)
+        os.replace(downloaded_file,object_path)
+        with self.locked_index() as index:
+            index['paths'][server_path] = sha256
+            index['objects'][sha256] = {'size':os.path.getsize(object_path),'used':time.time()}
+            self.evict(index,sha256)
+        return object_path
+
+    def evict(self,index,keep):
+        total = sum(entry['size'] for entry in index['objects'].values())
+        now = time.time()
+        for sha256,entry in sorted(index['objects'].items(),key=lambda item: item[1]['used']):
+            if total <= self.max_bytes:
+                break
+            if sha256 == keep or now-entry['used'] < self.min_age:
+                continue
+            if os.path.exists(self.object_path(sha256)):
+                os.remove(self.object_path(sha256))
+            total -= entry['size']
+            del index['objects'][sha256]
+        index['paths'] = {path:sha256 for path,sha256 in index['paths'].items() if sha256 in index['objects']}
+
+class InputArchive(object):
+    # the <folder>/ members of an input zip, read in place instead of extracting the zip
+    def __init__(self,zip_path,folder):
+        self.zip_path = zip_path
+        self.folder = folder
+        with ZipFile(zip_path,'r') as zipObj:
+            self.names = set(zipObj.namelist())
+
+    def subfolder(self,name):
+        # same zip, names looked up under <folder>/<name>/
+        archive = copy.copy(self)
+        archive.folder = self.member(name)
+        return archive
+
+    def member(self,name):
+        return self.folder+'/'+name
+
+    def exists(self,name):
+        return self.member(name) in self.names
+
+    def source(self,name):
+        return (self.zip_path,self.member(name))
+
+    def read(self,name):
+        with open_source(self.source(name)) as member_file:
+            return member_file.read()
+
+@contextmanager
+def open_source(source):
+    # binary file object for a path or for a (zip path, member) pair from InputArchive.source
+    if isinstance(source,tuple):
+        with ZipFile(source[0],'r') as zipObj:
+            with zipObj.open(source[1]) as member_file:
+                yield member_file
+    else:
+        with open(source,'rb') as data_file:
+            yield data_file
@@ -0,0 +1,84 @@
+import os
+import shutil
+import subprocess
+from zipfile import ZipFile
+
+# pristine copy of the model folders, extracted once per backup zip.
+# task folders are cloned from it and reset by putting back only the files whose size or mtime
+# no longer match the template, files the task added are removed
+
+manifests = {}
+
+def template_for_zip(cache_dir,zip_path):
+    # one template per zip version, a new backup zip gets a new template
+    zip_stat = os.stat(zip_path)
+    zip_name = os.path.basename(zip_path)
+    template_root = os.path.join(cache_dir,'model_template')
+    template = os.path.join(template_root,'%s_%d_%d' % (zip_name,zip_stat.st_mtime_ns,zip_stat.st_size))
+    if os.path.isdir(template):
+        return template
+    os.makedirs(template_root,exist_ok=True)
+    temp_dir = template+'.'+str(os.getpid())+'.tmp'
+    shutil.rmtree(temp_dir,ignore_errors=True)
+    with ZipFile(zip_path,'r') as zipObj:
+        zipObj.extractall(temp_dir)
+    try:
+        os.rename(temp_dir,template)
+    except OSError:
+        # another worker extracted the same zip first
+        shutil.rmtree(temp_dir,ignore_errors=True)
+    for name in os.listdir(template_root):
+        path = os.path.join(template_root,name)
+        if path != template and name.startswith(zip_name+'_') and not name.endswith('.tmp'):
+            shutil.rmtree(path,ignore_errors=True)
+    return template
+
+def tree_manifest(root):
+    # relative path -> (size, mtime) for files, set of relative paths for folders
+    files = {}
+    dirs = set()
+    for folder,dir_names,file_names in os.walk(root):
+        rel_folder = os.path.relpath(folder,root)
+        for name in dir_names:
+            dirs.add(os.path.normpath(os.path.join(rel_folder,name)))
+        for name in file_names:
+            file_stat = os.lstat(os.path.join(folder,name))
+            files[os.path.normpath(os.path.join(rel_folder,name))] = (file_stat.st_size,file_stat.st_mtime_ns)
+    return files,dirs
+
+def template_manifest(template):
+    # templates never change once extracted, so they are walked once per process
+    if template not in manifests:
+        manifests[template] = tree_manifest(template)
+    return manifests[template]
+
+def clone_tree(template,dest):
+    # copy on write where the filesystem supports it (cp --reflink=auto), mtimes are kept so the clone matches the manifest
+    dest = dest.rstrip('/')
+    if os.path.exists(dest):
+        shutil.rmtree(dest)
+    os.makedirs(os.path.dirname(dest),exist_ok=True)
+    if subprocess.call(['cp','-a','--reflink=auto',template,dest]) != 0:
+        shutil.rmtree(dest,ignore_errors=True)
+        shutil.copytree(template,dest)
+
+def restore_tree(template,dest):
+    # returns the number of files copied back from the template
+    files,dirs = template_manifest(template)
+    if not os.path.isdir(dest):
+        clone_tree(template,dest)
+        return len(files)
+    dest_files,dest_dirs = tree_manifest(dest)
+    for rel_path in dest_files:
+        if rel_path not in files:
+            os.remove(os.path.join(dest,rel_path))
+    for rel_path in sorted(dest_dirs - dirs,reverse=True):
+        shutil.rmtree(os.path.join(dest,rel_path),ignore_errors=True)
+    for rel_path in sorted(dirs - dest_dirs):
+        os.makedirs(os.path.join(dest,rel_path),exist_ok=True)
+    restored = 0
+    for rel_path,file_key in files.items():
+        if dest_files.get(rel_path) != file_key:
+            shutil.copy2(os.path.join(template,rel_path),os.path.join(dest,rel_path))
+            restored += 1
+    return restored
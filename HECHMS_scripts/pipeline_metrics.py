@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import fcntl
+import resource
+import threading
+from contextlib import contextmanager
+
+# per stage measurements of a task, written as json lines to <metrics dir>/traces/<uuid>.jsonl:
+#   wall and cpu seconds, cpu of child processes (hec-hms jvms, scp) that exited during the stage,
+#   peak rss of this process during the stage, largest child rss so far, bytes read and written from /proc/self/io
+#   (reaped children included). counters are per process, so stages running at the same time in one process share them.
+# every finished stage also updates the rolling aggregates in <metrics dir>/hechms.prom for the node exporter textfile collector
+
+ROLLING_WINDOW = 100
+QUANTILES = (0.5,0.95)
+
+active = threading.local()
+
+def read_proc_fields(path,keys):
+    fields = {}
+    try:
+        with open(path) as proc_file:
+            for line in proc_file:
+                key,value = line.split(':',1)
+                if key in keys:
+                    fields[key] = int(value.split()[0])
+    except (OSError,ValueError):
+        pass
+    return fields
+
+def reset_peak_rss():
+    # linux 4.0+, VmHWM starts again from the current rss
+    try:
+        with open('/proc/self/clear_refs','w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+def process_counters():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    counters = {'wall':time.time(),'cpu':usage.ru_utime+usage.ru_stime,'children_cpu':children.ru_utime+children.ru_stime,
+                'children_max_rss_kb':children.ru_maxrss,'read_bytes':0,'write_bytes':0}
+    counters.update(read_proc_fields('/proc/self/io',('read_bytes','write_bytes')))
+    counters['peak_rss_kb'] = read_proc_fields('/proc/self/status',('VmHWM',)).get('VmHWM',usage.ru_maxrss)
+    return counters
+
+class TaskTrace(object):
+    def __init__(self,metrics_dir,task_id,source,phase):
+        self.metrics_dir = metrics_dir
+        self.task_id = task_id
+        self.source = source
+        self.phase = phase
+        self.status = 'ok'
+        self.started = time.time()
+        self.stage_name = None
+        self.stage_start = None
+        os.makedirs(os.path.join(metrics_dir,'traces'),exist_ok=True)
+
+    def write(self,record):
+        record.update({'uuid':self.task_id,'source':self.source,'phase':self.phase,'pid':os.getpid()})
+        with open(os.path.join(self.metrics_dir,'traces',str(self.task_id)+'.jsonl'),'a') as trace_file:
+            trace_file.write(json.dumps(record)+'\n')
+
+    def start_stage(self,name):
+        self.end_stage()
+        reset_peak_rss()
+        self.stage_name = name
+        self.stage_start = process_counters()
+
+    def end_stage(self):
+        if self.stage_name is None:
+            return
+        end = process_counters()
+        start = self.stage_start
+        record = {'type':'stage','stage':self.stage_name,'start':start['wall'],
+                  'wall_s':round(end['wall']-start['wall'],3),
+                  'cpu_s':round(end['cpu']-start['cpu'],3),
+                  'children_cpu_s':round(end['children_cpu']-start['children_cpu'],3),
+                  'peak_rss_kb':end['peak_rss_kb'],
+                  'children_max_rss_kb':end['children_max_rss_kb'],
+                  'read_bytes':end['read_bytes']-start['read_bytes'],
+                  'write_bytes':end['write_bytes']-start['write_bytes']}
+        self.stage_name = None
+        self.write(record)
+        update_aggregates(self.metrics_dir,self.source,record)
+
+    def finish(self):
+        self.end_stage()
+        self.write({'type':'task','status':self.status,'start':self.started,'wall_s':round(time.time()-self.started,3)})
+        update_aggregates(self.metrics_dir,self.source,None,(self.phase,self.status))
+
+@contextmanager
+def trace_task(metrics_dir,task_id,source,phase):
+    # yields the trace, or None when metrics_dir is empty and nothing is recorded
+    if not metrics_dir:
+        yield None
+        return
+    trace = TaskTrace(metrics_dir,task_id,source,phase)
+    previous = getattr(active,'trace',None)
+    active.trace = trace
+    try:
+        yield trace
+    except Exception:
+        trace.status = 'error'
+        raise
+    finally:
+        active.trace = previous
+        trace.finish()
+
+def stage(name):
+    # ends the running stage of this thread's task and starts the next one, does nothing outside trace_task
+    trace = getattr(active,'trace',None)
+    if trace is not None:
+        trace.start_stage(name)
+
+def quantile(values,q):
+    values = sorted(values)
+    return values[min(int(q*len(values)),len(values)-1)]
+
+def update_aggregates(metrics_dir,source,record,task_status=None):
+    # aggregates of every process live in one json file changed under an flock, the .prom file is written from it
+    state_path = os.path.join(metrics_dir,'aggregates.json')
+    with open(state_path+'.lock','a') as lock_file:
+        fcntl.flock(lock_file,fcntl.LOCK_EX)
+        try:
+            state = {'stages':{},'tasks':{}}
+            if os.path.exists(state_path):
+                with open(state_path) as state_file:
+                    state = json.load(state_file)
+            if record is not None:
+                entry = state['stages'].setdefault(source+'|'+record['stage'],{'count':0,'wall_s':0,'cpu_s':0,'children_cpu_s':0,
+                                                                                'read_bytes':0,'write_bytes':0,'recent_wall_s':[],'recent_peak_rss_kb':[]})
+                entry['count'] += 1
+                for key in ['wall_s','cpu_s','children_cpu_s','read_bytes','write_bytes']:
+                    entry[key] += record[key]
+                entry['recent_wall_s'] = (entry['recent_wall_s']+[record['wall_s']])[-ROLLING_WINDOW:]
+                entry['recent_peak_rss_kb'] = (entry['recent_peak_rss_kb']+[max(record['peak_rss_kb'],record['children_max_rss_kb'])])[-ROLLING_WINDOW:]
+            if task_status is not None:
+                key = source+'|'+'|'.join(task_status)
+                state['tasks'][key] = state['tasks'].get(key,0)+1
+            temp_path = state_path+'.'+str(os.getpid())+'.tmp'
+            with open(temp_path,'w') as state_file:
+                json.dump(state,state_file)
+            os.replace(temp_path,state_path)
+            write_textfile(os.path.join(metrics_dir,'hechms.prom'),state)
+        finally:
+            fcntl.flock(lock_file,fcntl.LOCK_UN)
+
+def write_textfile(prom_path,state):
+    lines = ['# HELP hechms_stage_seconds wall time of pipeline stages, quantiles over the last %d runs' % ROLLING_WINDOW,
+             '# TYPE hechms_stage_seconds summary']
+    other = {'hechms_stage_cpu_seconds_total':[],'hechms_stage_children_cpu_seconds_total':[],'hechms_stage_read_bytes_total':[],
+             'hechms_stage_write_bytes_total':[],'hechms_stage_peak_rss_bytes':[]}
+    for key in sorted(state['stages']):
+        entry = state['stages'][key]
+        source,stage_name = key.split('|')
+        labels = 'source="%s",stage="%s"' % (source,stage_name)
+        for q in QUANTILES:
+            lines.append('hechms_stage_seconds{%s,quantile="%s"} %s' % (labels,q,quantile(entry['recent_wall_s'],q)))
+        lines.append('hechms_stage_seconds_sum{%s} %s' % (labels,round(entry['wall_s'],3)))
+        lines.append('hechms_stage_seconds_count{%s} %d' % (labels,entry['count']))
+        other['hechms_stage_cpu_seconds_total'].append('{%s} %s' % (labels,round(entry['cpu_s'],3)))
+        other['hechms_stage_children_cpu_seconds_total'].append('{%s} %s' % (labels,round(entry['children_cpu_s'],3)))
+        other['hechms_stage_read_bytes_total'].append('{%s} %d' % (labels,entry['read_bytes']))
+        other['hechms_stage_write_bytes_total'].append('{%s} %d' % (labels,entry['write_bytes']))
+        other['hechms_stage_peak_rss_bytes'].append('{%s} %d' % (labels,max(entry['recent_peak_rss_kb'])*1024))
+    for name,samples in other.items():
+        lines.append('# TYPE %s %s' % (name,'gauge' if name == 'hechms_stage_peak_rss_bytes' else 'counter'))
+        lines.extend(name+sample for sample in samples)
+    lines.append('# TYPE hechms_tasks_total counter')
+    for key in sorted(state['tasks']):
+        source,phase,status = key.split('|')
+        lines.append('hechms_tasks_total{source="%s",phase="%s",status="%s"} %d' % (source,phase,status,state['tasks'][key]))
+    temp_path = prom_path+'.'+str(os.getpid())+'.tmp'
+    with open(temp_path,'w') as prom_file:
+        prom_file.write('\n'.join(lines)+'\n')
+    os.replace(temp_path,prom_path)
@@ -0,0 +1,122 @@
+import os
+import json
+import fcntl
+import hashlib
+import numpy as np
+from contextlib import contextmanager
+from input_cache import open_source
+
+# daily rainfall grids of one source, kept across tasks in a memory mapped ring of <days> slots (<store>/<source>/grid.npy).
+# a date always lives in slot date.toordinal() % days, so a window of consecutive dates is one slice of the file
+# (two when it wraps around the end). index.json keeps the date and content hash of every slot, a daily file is only
+# parsed when its date is missing or its content changed. newer dates overwrite the slots of dates <days> older,
+# so the store never holds more than <days> days. everything happens under an flock, tasks of one source take turns
+
+class RainfallStore(object):
+    def __init__(self,store_dir,source,days=120):
+        self.source_dir = os.path.join(store_dir,source)
+        self.days = days
+        self.grid_path = os.path.join(self.source_dir,'grid.npy')
+        self.index_path = os.path.join(self.source_dir,'index.json')
+        os.makedirs(self.source_dir,exist_ok=True)
+
+    def slot(self,date_value):
+        return date_value.toordinal() % self.days
+
+    @contextmanager
+    def locked_index(self):
+        with open(self.index_path+'.lock','a') as lock_file:
+            fcntl.flock(lock_file,fcntl.LOCK_EX)
+            try:
+                index = {'slots':{}}
+                if os.path.exists(self.index_path):
+                    with open(self.index_path) as index_file:
+                        index = json.load(index_file)
+                try:
+                    yield index
+                finally:
+                    # written even when ingesting failed, a slot is dropped from the index before it is overwritten
+                    temp_path = self.index_path+'.'+str(os.getpid())+'.tmp'
+                    with open(temp_path,'w') as index_file:
+                        json.dump(index,index_file)
+                    os.replace(temp_path,self.index_path)
+            finally:
+                fcntl.flock(lock_file,fcntl.LOCK_UN)
+
+    def open_grid(self,index):
+        if not index['slots'] or not os.path.exists(self.grid_path):
+            return None
+        grid = np.load(self.grid_path,mmap_mode='r+')
+        if grid.shape[0] != self.days:
+            return None
+        axes = np.load(os.path.join(self.source_dir,'axes.npz'))
+        return grid,axes['lat'],axes['lon']
+
+    def create_grid(self,index,grid_lat,grid_lon):
+        # new store, or the grid axes changed and every stored day is dropped
+        np.savez(os.path.join(self.source_dir,'axes.npz'),lat=grid_lat,lon=grid_lon)
+        grid = np.lib.format.open_memmap(self.grid_path,mode='w+',dtype=np.float32,shape=(self.days,len(grid_lat),len(grid_lon)))
+        grid.fill(np.nan)
+        index['slots'] = {}
+        return grid
+
+    def window_slice(self,grid,dates):
+        first = self.slot(dates[0])
+        if first+len(dates) <= self.days:
+            return grid[first:first+len(dates)]    ##a view of the memory map, nothing is copied
+        return np.concatenate([grid[first:],grid[:first+len(dates)-self.days]])
+
+    @contextmanager
+    def window(self,dates,sources,read_days):
+        # yields (grid window, lat, lon) for consecutive dates, sources are the daily files of the task (paths or InputArchive
+        # sources) and read_days(sources) yields (lat, lon, rainfall) for each of them in order
+        if len(dates) > self.days:
+            raise ValueError('%d day window is longer than the %d day rainfall store' % (len(dates),self.days))
+        hashes = [source_sha256(source) for source in sources]
+        restart = False
+        with self.locked_index() as index:
+            opened = self.open_grid(index)
+            stale = [i for i,date_value in enumerate(dates)
+                     if opened is None or index['slots'].get(str(self.slot(date_value))) != [date_value.isoformat(),hashes[i]]]
+            created = False
+            days_read = read_days([sources[i] for i in stale])
+            for i,(lat,lon,rainfall) in zip(stale,days_read):
+                if opened is None:
+                    grid_lat = np.unique(lat)
+                    grid_lon = np.unique(lon)
+                    opened = (self.create_grid(index,grid_lat,grid_lon),grid_lat,grid_lon)
+                    created = True
+                elif not axes_contain(opened[1],opened[2],lat,lon):
+                    if created:
+                        raise ValueError('daily grid does not match the lat/lon axes of the first day')
+                    restart = True    ##axes changed since the stored days, the store starts again from this window
+                    break
+                grid,grid_lat,grid_lon = opened
+                slot = self.slot(dates[i])
+                index['slots'].pop(str(slot),None)
+                grid[slot].fill(np.nan)
+                grid[slot,np.searchsorted(grid_lat,lat),np.searchsorted(grid_lon,lon)] = rainfall
+                index['slots'][str(slot)] = [dates[i].isoformat(),hashes[i]]
+            if restart:
+                days_read.close()
+                index['slots'] = {}
+            else:
+                opened[0].flush()
+                yield (self.window_slice(opened[0],dates),)+opened[1:]
+        if restart:
+            with self.window(dates,sources,read_days) as window:
+                yield window
+
+def axes_contain(grid_lat,grid_lon,lat,lon):
+    lat_idx = np.searchsorted(grid_lat,lat)
+    lon_idx = np.searchsorted(grid_lon,lon)
+    if (lat_idx >= len(grid_lat)).any() or (lon_idx >= len(grid_lon)).any():
+        return False
+    return np.array_equal(grid_lat[lat_idx],lat) and np.array_equal(grid_lon[lon_idx],lon)
+
+def source_sha256(source):
+    sha256 = hashlib.sha256()
+    with open_source(source) as data_file:
+        for chunk in iter(lambda: data_file.read(1024*1024),b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
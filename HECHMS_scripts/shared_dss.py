@@ -0,0 +1,62 @@
+import os
+import json
+import fcntl
+from contextlib import contextmanager
+
+# long lived rainfall dss of one source, <dss dir>/<source>/<dss name>.dss, that every task of the source computes from.
+# <dss>.index.json keeps the sha256 of every record written, a task only writes the records of its window whose content changed.
+# records are written under an exclusive flock, which is then turned into a shared one and held while hms reads the file,
+# so a task of the same source never rewrites records another task is computing from.
+# a dss file only gains records, once it would hold more than max_records the file is started again with only the records
+# of the task writing it (compaction), so it keeps about max_records days and its catalog does not grow without limit
+
+class SharedRainfallDss(object):
+    def __init__(self,dss_dir,source,dss_name,max_records=None):
+        self.dss_path = os.path.join(dss_dir,source,dss_name+'.dss')
+        self.max_records = max_records
+        self.index_path = self.dss_path+'.index.json'
+        os.makedirs(os.path.dirname(self.dss_path),exist_ok=True)
+
+    def load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                return json.load(index_file)
+        return {}
+
+    def save_index(self,index):
+        temp_path = self.index_path+'.'+str(os.getpid())+'.tmp'
+        with open(temp_path,'w') as index_file:
+            json.dump(index,index_file)
+        os.replace(temp_path,self.index_path)
+
+    @contextmanager
+    def reading(self,records,write_records):
+        # records: {pathname: sha256} of the task window. write_records(pathnames) writes those records to dss_path,
+        # yields dss_path once every record matches and keeps the shared lock until the caller is done
+        with open(self.dss_path+'.lock','a') as lock_file:
+            try:
+                while True:
+                    fcntl.flock(lock_file,fcntl.LOCK_EX)
+                    index = self.load_index()
+                    if self.max_records and len(set(index) | set(records)) > self.max_records:
+                        index = {}
+                        self.save_index(index)    ##emptied before the file goes, an index never lists records the file lacks
+                        if os.path.exists(self.dss_path):
+                            os.remove(self.dss_path)
+                    changed = [pathname for pathname,sha256 in records.items() if index.get(pathname) != sha256]
+                    for pathname in changed:
+                        index.pop(pathname,None)    ##a record half written when write_records fails is written again next time
+                    self.save_index(index)
+                    if changed:
+                        write_records(changed)
+                        index.update((pathname,records[pathname]) for pathname in changed)
+                        self.save_index(index)
+                    # flock does not turn an exclusive lock into a shared one atomically, another task may update in between
+                    fcntl.flock(lock_file,fcntl.LOCK_SH)
+                    index = self.load_index()
+                    if all(index.get(pathname) == sha256 for pathname,sha256 in records.items()):
+                        break
+                self.changed = changed
+                yield self.dss_path
+            finally:
+                fcntl.flock(lock_file,fcntl.LOCK_UN)
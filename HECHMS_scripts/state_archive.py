@@ -0,0 +1,65 @@
+import os
+import shutil
+import datetime
+from model_template import tree_manifest
+
+# hec-hms state files saved at the forecast date of a task, kept per run type as <archive>/<run type>/<YYYYMMDD>/
+# with the paths they had under the model folder. a date folder is moved into place complete, so a folder
+# that exists is a usable state. the next task of the run type starts from the newest state inside its window
+
+DATE_FORMAT = '%Y%m%d'
+
+class StateArchive(object):
+    def __init__(self,archive_dir,keep_days=30):
+        self.archive_dir = archive_dir
+        self.keep_days = keep_days
+
+    def source_dir(self,source):
+        return os.path.join(self.archive_dir,source)
+
+    def dates(self,source):
+        dates = []
+        if os.path.isdir(self.source_dir(source)):
+            for name in os.listdir(self.source_dir(source)):
+                try:
+                    dates.append(datetime.datetime.strptime(name,DATE_FORMAT).date())
+                except ValueError:
+                    continue
+        return sorted(dates)
+
+    def nearest(self,source,start_date,forecast_date):
+        # newest state from start_date up to the day before forecast_date, None when there is none
+        dates = [state_date for state_date in self.dates(source) if start_date <= state_date < forecast_date]
+        return dates[-1] if dates else None
+
+    def save(self,source,state_date,model_path,rel_paths):
+        state_dir = os.path.join(self.source_dir(source),state_date.strftime(DATE_FORMAT))
+        temp_dir = state_dir+'.'+str(os.getpid())+'.tmp'
+        shutil.rmtree(temp_dir,ignore_errors=True)
+        for rel_path in rel_paths:
+            os.makedirs(os.path.dirname(os.path.join(temp_dir,rel_path)),exist_ok=True)
+            shutil.copy2(os.path.join(model_path,rel_path),os.path.join(temp_dir,rel_path))
+        if os.path.exists(state_dir):
+            shutil.rmtree(state_dir)
+        os.rename(temp_dir,state_dir)
+        self.prune(source,state_date)
+        return state_dir
+
+    def restore(self,source,state_date,model_path):
+        # copies the state files back to where hms wrote them, returns their relative paths
+        state_dir = os.path.join(self.source_dir(source),state_date.strftime(DATE_FORMAT))
+        rel_paths = sorted(tree_manifest(state_dir)[0])
+        for rel_path in rel_paths:
+            os.makedirs(os.path.dirname(os.path.join(model_path,rel_path)),exist_ok=True)
+            shutil.copy2(os.path.join(state_dir,rel_path),os.path.join(model_path,rel_path))
+        return rel_paths
+
+    def prune(self,source,newest_date):
+        for state_date in self.dates(source):
+            if (newest_date-state_date).days > self.keep_days:
+                shutil.rmtree(os.path.join(self.source_dir(source),state_date.strftime(DATE_FORMAT)),ignore_errors=True)
+
+def saved_state_files(before,after,state_name):
+    # files hms wrote or changed during the compute whose name carries the state name
+    return sorted(rel_path for rel_path,file_key in after.items()
+                  if state_name in os.path.basename(rel_path) and before.get(rel_path) != file_key)
@@ -0,0 +1,146 @@
+import os
+import shlex
+import shutil
+import hashlib
+import logging
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# file transfers between this machine and the task server.
+#   ScpTransfer   - scp/ssh sharing one multiplexed ssh connection (ControlMaster), so only the first transfer pays for the handshake
+#   LocalTransfer - copies between local folders, for testing without a server
+# every transfer is retried with exponential backoff and checked against the sha256 of the other side
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path,'rb') as data_file:
+        for chunk in iter(lambda: data_file.read(1 << 20),b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+class Transfer(object):
+    def __init__(self,retries=3,backoff=5,verify=True):
+        self.retries = retries
+        self.backoff = backoff
+        self.verify = verify
+
+    def remote_file(self,local_file,remote_path):
+        # a remote path ending in / is a folder, the file keeps its name there
+        if remote_path.endswith('/'):
+            return remote_path+os.path.basename(local_file)
+        return remote_path
+
+    def retry(self,action,*args):
+        wait = self.backoff
+        for attempt in range(self.retries+1):
+            try:
+                action(*args)
+                return True
+            except Exception as e:
+                logging.info('transfer attempt %d of %d failed :: %s',attempt+1,self.retries+1,e)
+                if attempt < self.retries:
+                    time.sleep(wait)
+                    wait *= 2
+        return False
+
+    def upload_once(self,local_file,remote_path):
+        self.put(local_file,remote_path)
+        if self.verify and self.checksum(self.remote_file(local_file,remote_path)) != file_sha256(local_file):
+            raise Exception('checksum mismatch after upload :: '+local_file)
+
+    def download_once(self,remote_path,local_file):
+        self.get(remote_path,local_file)
+        if self.verify and self.checksum(remote_path) != file_sha256(local_file):
+            raise Exception('checksum mismatch after download :: '+remote_path)
+
+    def upload(self,local_file,remote_path):
+        return self.retry(self.upload_once,local_file,remote_path)
+
+    def download(self,remote_path,local_path):
+        # local_path may be a folder, returns the local file or None when every attempt failed
+        local_file = local_path
+        if local_path.endswith('/') or os.path.isdir(local_path):
+            local_file = os.path.join(local_path,os.path.basename(remote_path))
+        if self.retry(self.download_once,remote_path,local_file):
+            return local_file
+        return None
+
+    def upload_many(self,files):
+        # [(local file, remote path)] -> [uploaded], all files at once
+        with ThreadPoolExecutor(max_workers=max(len(files),1)) as executor:
+            return list(executor.map(lambda job: self.upload(*job),files))
+
+class ScpTransfer(Transfer):
+    def __init__(self,server,scp_command='scp',ssh_command='ssh',control_dir='/tmp/',persist=600,**kwargs):
+        Transfer.__init__(self,**kwargs)
+        self.server = server
+        os.makedirs(control_dir,exist_ok=True)
+        control_options = ['-o','ControlMaster=auto','-o','ControlPath='+os.path.join(control_dir,'%C'),'-o','ControlPersist='+str(persist)]
+        self.scp = shlex.split(scp_command)+control_options
+        self.ssh = shlex.split(ssh_command)+control_options
+        self.connected = False
+        self.lock = threading.Lock()
+
+    def run(self,command):
+        completed = subprocess.run(command,stdout=subprocess.PIPE,stderr=subprocess.PIPE,universal_newlines=True)
+        if completed.returncode != 0:
+            raise Exception(' '.join(command)+' :: exit '+str(completed.returncode)+' :: '+completed.stderr.strip())
+        return completed.stdout
+
+    def connect(self):
+        # opens the master connection once, concurrent transfers then share it instead of racing to open their own.
+        # ssh reopens it by itself when it was closed after ControlPersist seconds idle
+        with self.lock:
+            if not self.connected:
+                self.run(self.ssh+[self.server,'true'])
+                self.connected = True
+
+    def put(self,local_file,remote_path):
+        self.connect()
+        self.run(self.scp+[local_file,self.server+':'+remote_path])
+
+    def get(self,remote_path,local_file):
+        self.connect()
+        self.run(self.scp+[self.server+':'+remote_path,local_file])
+
+    def checksum(self,remote_file):
+        self.connect()
+        return self.run(self.ssh+[self.server,'sha256sum '+shlex.quote(remote_file)]).split()[0]
+
+    def remote_file(self,local_file,remote_path):
+        # scp also copies into a remote folder named without the trailing /, ask the server what the path is
+        if not remote_path.endswith('/'):
+            self.connect()
+            completed = subprocess.run(self.ssh+[self.server,'test -d '+shlex.quote(remote_path)],stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+            if completed.returncode == 0:
+                return remote_path+'/'+os.path.basename(local_file)
+        return Transfer.remote_file(self,local_file,remote_path)
+
+class LocalTransfer(Transfer):
+    def __init__(self,root='',**kwargs):
+        # server paths are taken below root, or as they are when root is empty
+        Transfer.__init__(self,**kwargs)
+        self.root = root
+
+    def local_path(self,remote_path):
+        if self.root:
+            return os.path.join(self.root,remote_path.lstrip('/'))
+        return remote_path
+
+    def remote_file(self,local_file,remote_path):
+        if os.path.isdir(self.local_path(remote_path)):
+            return os.path.join(remote_path,os.path.basename(local_file))
+        return Transfer.remote_file(self,local_file,remote_path)
+
+    def put(self,local_file,remote_path):
+        destination = self.local_path(self.remote_file(local_file,remote_path))
+        os.makedirs(os.path.dirname(destination) or '.',exist_ok=True)
+        shutil.copy2(local_file,destination)
+
+    def get(self,remote_path,local_file):
+        shutil.copy2(self.local_path(remote_path),local_file)
+
+    def checksum(self,remote_file):
+        return file_sha256(self.local_path(remote_file))
@@ -0,0 +1,144 @@
+import os
+import sys
+import types
+import pickle
+import datetime
+import numpy as np
+
+# local stand-in for the two dss apis the pipeline uses, so stages can be timed without heclib:
+#   pydsstools (HecDss.Open / put / put_grid / read_ts) used by hechms_godavari.py
+#   hec.heclib.dss (HecDss.open / getCatalogedPathnames / get) used by the jython scripts, e.g. dssoutput.py
+# a stand-in dss file is a pickled {pathname: record} dict, read on open and written on close.
+# time series reads keep only the requested window, read_ts(trim_missing=False) fills the steps the record lacks with UNDEFINED
+
+UNDEFINED = -3.4028234663852886e+38
+HEC_EPOCH = datetime.datetime(1899,12,31)
+
+def hec_minutes(date_time):
+    # '01JUN2023 00:00:00', '01JUN2023 0000' or '10JUN2023 24:00' -> minutes since 31Dec1899 0000
+    day,clock = date_time.split()
+    clock = clock.replace(':','')
+    return int((datetime.datetime.strptime(day,'%d%b%Y')-HEC_EPOCH).total_seconds()//60)+int(clock[:2])*60+int(clock[2:4])
+
+def window_values(pathname,record,start,end,trim_missing=True):
+    times = np.asarray(record.get('times',[]),dtype=np.int64)
+    values = np.asarray(record['values'],dtype=np.float64)
+    if start is None:
+        return times,values
+    start,end = hec_minutes(start),hec_minutes(end)
+    keep = (times >= start) & (times <= end)
+    times,values = times[keep],values[keep]
+    interval = pathname.split('/')[5]
+    if trim_missing or not interval.endswith('MIN'):
+        return times,values
+    interval = int(interval[:-3])
+    steps = np.arange(-(-start//interval)*interval,end+1,interval)
+    step_values = np.full(len(steps),UNDEFINED)
+    step_values[np.searchsorted(steps,times)] = values
+    return steps,step_values
+
+def load_records(path):
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path,'rb') as dss_file:
+            return pickle.load(dss_file)
+    return {}
+
+def save_records(path,records):
+    with open(path,'wb') as dss_file:
+        pickle.dump(records,dss_file,protocol=pickle.HIGHEST_PROTOCOL)
+
+class TimeSeriesContainer(object):
+    def __init__(self):
+        self.pathname = ''
+        self.interval = 0
+        self.values = []
+        self.times = []
+        self.startDateTime = ''
+        self.numberValues = 0
+        self.units = ''
+        self.type = ''
+
+class GridInfo(dict):
+    pass
+
+class PyDssFile(object):
+    def __init__(self,path):
+        self.path = path
+        self.records = load_records(path)
+        self.condensed = None
+
+    @classmethod
+    def Open(cls,path,*args,**kwargs):
+        return cls(path)
+
+    def put(self,tsc):
+        self.condensed = None
+        self.records[tsc.pathname] = {'values':np.asarray(tsc.values,dtype=np.float64),'start':tsc.startDateTime,
+                                      'interval':tsc.interval,'units':tsc.units,'type':tsc.type}
+
+    def put_grid(self,pathname,data,grid_info,*args,**kwargs):
+        self.condensed = None
+        self.records[pathname] = {'grid':np.asarray(data,dtype=np.float32),'info':{key:str(value) for key,value in grid_info.items()}}
+
+    def read_ts(self,pathname,window=None,trim_missing=True,*args,**kwargs):
+        if self.condensed is None:
+            self.condensed = {condensed_pathname(path):record for path,record in self.records.items()}
+        record = self.condensed[condensed_pathname(pathname)]
+        tsc = TimeSeriesContainer()
+        tsc.pathname = pathname
+        tsc.times,tsc.values = window_values(pathname,record,*(window or (None,None)),trim_missing=trim_missing)
+        tsc.numberValues = len(tsc.values)
+        return tsc
+
+    def getPathnameList(self,pattern='',*args,**kwargs):
+        # the pattern is not applied, callers filter the catalog themselves
+        return list(self.records)
+
+    def close(self):
+        save_records(self.path,self.records)
+
+class HecRecord(object):
+    # what hec.heclib.dss get() returns to the jython scripts: minutes since 31Dec1899 and values
+    def __init__(self,times,values):
+        self.times = times
+        self.values = values
+
+def condensed_pathname(pathname):
+    # D part (block start date) left empty, heclib reads a condensed pathname across all blocks of the record
+    parts = pathname.split('/')
+    if len(parts) > 4:
+        parts[4] = ''
+    return '/'.join(parts)
+
+class JythonDssFile(object):
+    def __init__(self,path):
+        self.records = load_records(path)
+        self.condensed = {condensed_pathname(pathname):record for pathname,record in self.records.items()}
+
+    @classmethod
+    def open(cls,path,*args):
+        return cls(path)
+
+    def getCatalogedPathnames(self,*args):
+        return list(self.records)
+
+    def get(self,pathname,start=None,end=None):
+        record = self.condensed[condensed_pathname(pathname)]
+        times,values = window_values(pathname,record,start,end)
+        return HecRecord(times.tolist(),values.tolist())
+
+    def done(self):
+        pass
+
+def install():
+    # replaces the real libraries in sys.modules, so timings never depend on whether heclib is installed
+    modules = {}
+    for name in ['pydsstools','pydsstools.heclib','pydsstools.heclib.dss','pydsstools.heclib.utils','pydsstools.core',
+                 'hec','hec.heclib','hec.heclib.dss']:
+        modules[name] = types.ModuleType(name)
+    modules['pydsstools.heclib.dss'].HecDss = PyDssFile
+    modules['pydsstools.heclib.utils'].gridInfo = GridInfo
+    modules['pydsstools.core'].TimeSeriesContainer = TimeSeriesContainer
+    modules['pydsstools.core'].UNDEFINED = UNDEFINED
+    modules['hec.heclib.dss'].HecDss = JythonDssFile
+    sys.modules.update(modules)
@@ -0,0 +1,179 @@
+import os
+import csv
+import datetime
+import numpy as np
+import pandas as pd
+import dss_stand_in
+
+# synthetic inputs in the layouts the pipeline reads, laid out under one work folder with a constants
+# dict pointing at them. everything comes from one seeded generator, so a scale and seed always give the same files.
+# godavari is about the real basin on the IMD 0.25 degree grid, large is ECMWF-like resolution and a denser model
+
+SCALES = {
+    'small':    {'grid_step':0.5, 'days':10,'obs_days':5, 'stations':20,  'subbasins':50,  'gages':20,  'sc_targets':20,  'sc_contributors':4},
+    'godavari': {'grid_step':0.25,'days':55,'obs_days':15,'stations':250, 'subbasins':400, 'gages':250, 'sc_targets':150, 'sc_contributors':4},
+    'large':    {'grid_step':0.1, 'days':90,'obs_days':30,'stations':1000,'subbasins':2000,'gages':1000,'sc_targets':600, 'sc_contributors':6},
+}
+
+BASIN_LAT = (16.5,22.9)
+BASIN_LON = (73.4,83.1)
+START_DATE = datetime.date(2023,6,1)
+DSS_NAME = 'Forecast_IMD'
+HEC_EPOCH = datetime.datetime(1899,12,31)
+
+def task_dates(scale):
+    start = START_DATE
+    return start,start+datetime.timedelta(scale['obs_days']),start+datetime.timedelta(scale['days']-1)
+
+def folder_name(scale):
+    start,forecast,end = task_dates(scale)
+    return '_'.join(d.strftime('%Y%m%d') for d in (start,forecast,end))+'_1700000000000'
+
+def station_ids(scale):
+    return [str(1001+i) for i in range(scale['stations'])]
+
+def write_grid_days(rng,scale,grid_dir):
+    lat = np.round(np.arange(BASIN_LAT[0],BASIN_LAT[1],scale['grid_step']),4)
+    lon = np.round(np.arange(BASIN_LON[0],BASIN_LON[1],scale['grid_step']),4)
+    cell_lat,cell_lon = [axis.ravel() for axis in np.meshgrid(lat,lon,indexing='ij')]
+    start,forecast,end = task_dates(scale)
+    for day in pd.date_range(start,end,freq='D'):
+        rainfall = np.round(rng.gamma(0.6,8.0,len(cell_lat)),2)
+        pd.DataFrame({'lat':cell_lat,'lon':cell_lon,'rainfall':rainfall}).to_csv(grid_dir+day.strftime('%Y%m%d'),header=False,index=False)
+    return len(cell_lat)
+
+def write_observed(rng,scale,path):
+    # daily inflow and outflow per station up to the forecast date, about 2% negative (missing) values
+    start,forecast,end = task_dates(scale)
+    days = pd.date_range(start,periods=scale['obs_days'],freq='D')
+    rows = []
+    for stn in station_ids(scale):
+        for flow_type in ['Inflow','Outflow']:
+            flows = np.round(rng.lognormal(6,1,len(days)),2)
+            flows[rng.random(len(days)) < 0.02] = -1
+            for day,flow in zip(days,flows):
+                rows.append([stn,flow_type,day.year,day.month,day.day,8,30,flow])
+    pd.DataFrame(rows).to_csv(path,header=False,index=False)
+
+def write_hms_templates(rng,scale,model_dir):
+    with open(model_dir+'Godavari.basin','w') as basin:
+        basin.write('Basin: Godavari\n     Description: synthetic\n     Version: 4.10\nEnd:\n\n')
+        for i in range(scale['subbasins']):
+            basin.write('Subbasin: S%d\n     Canvas X: %.1f\n     Canvas Y: %.1f\n     Area: %.2f\n     Downstream: J%d\n\n'
+                        '     LossRate: SCS\n     Percent Impervious Area: 0.0\n     Curve Number: %d\n     Initial Abstraction: 5\n\n'
+                        '     Transform: Clark\n     Time of Concentration: %.1f\n     Storage Coefficient: %.1f\nEnd:\n\n'
+                        % (i+1,rng.random()*1e6,rng.random()*1e6,rng.random()*500,i//4+1,rng.integers(55,90),rng.random()*20,rng.random()*20))
+        for j in range(scale['subbasins']//4+1):
+            basin.write('Junction: J%d\n     Canvas X: %.1f\n     Canvas Y: %.1f\n     Downstream: J%d\nEnd:\n\n' % (j+1,rng.random()*1e6,rng.random()*1e6,j+2))
+    pd.DataFrame({'Name':['S%d' % (i+1) for i in range(scale['subbasins'])],
+                  'CN3':rng.integers(70,98,scale['subbasins'])}).to_csv(model_dir+'cn_godavari.csv',index=False)
+
+    with open(model_dir+'Godavari.grid','w') as grid:
+        grid.write('Grid Manager: Godavari\n     Version: 4.10\nEnd:\n\n')
+        for name in ['IMD','ECMWF_DET','ECMWF_ENS']:
+            grid.write('Grid: %s\n     Grid Type: Precipitation\n     Last Modified Date: 1 June 2023\n     Reference Height Units: Meters\n'
+                       '     Data Source Type: External DSS\n     Variant: Variant-1\n       Last Variant Modified Date: 1 June 2023\n'
+                       '       Default Variant: Yes\n       DSS File Name: data/%s.dss\n'
+                       '       DSS Pathname: /UTM44N/TN_AP/PRECIPITATION/01JUN2023:0000/02JUN2023:0000/GODAVARI/\n     End Variant: Variant-1\nEnd:\n\n' % (name,name))
+
+    with open(model_dir+'Godavari.gage','w') as gage:
+        gage.write('Gage Manager: Godavari\n     Version: 4.10\nEnd:\n\n')
+        for i in range(scale['gages']):
+            gage.write('Gage: G%d\n     Gage Type: Flow\n     Units: CMS\n     Data Type: PER-AVER\n     Data Source Type: External DSS\n'
+                       '     Variant: Variant-1\n       DSS File Name: obs/G%d.dss\n       DSS Pathname: /GODAVARI/OBSERVED/FLOW//1DAY/OBSERVED/\n'
+                       '       Start Time: 1 June 2023, 08:30\n       End Time: 15 June 2023, 08:30\n     End Variant: Variant-1\nEnd:\n\n' % (i+1,i+1))
+
+    os.makedirs(model_dir+'forecast/',exist_ok=True)
+    with open(model_dir+'forecast/'+DSS_NAME+'.forecast','w') as forecast:
+        forecast.write('Forecast: %s\n     Description: synthetic\n     Start Date: 1 June 2023\n     Start Time: 08:30\n'
+                       '     Forecast Date: 15 June 2023\n     Forecast Time: 08:30\n     End Date: 24 July 2023\n     End Time: 08:30\n'
+                       '     Time Interval: 30\n     Basin: Godavari\n     Precip: IMD\nEnd:\n\n' % DSS_NAME)
+        for i in range(scale['gages']):
+            forecast.write('Element: G%d\n     Start Date: 1 June 2023\n     End Date: 24 July 2023\n     Blend Method: Exponential\nEnd:\n\n' % (i+1))
+
+def write_flow_output(rng,stations,start,end,path):
+    # 13 column fc/sc csv with hourly :30 rows, as written by dssoutput.py
+    steps = pd.date_range(pd.Timestamp(start)+pd.Timedelta(minutes=30),pd.Timestamp(end)+pd.Timedelta(hours=23,minutes=30),freq='h')
+    expiry = steps+pd.Timedelta(minutes=59)
+    frames = []
+    for stn in stations:
+        frames.append(pd.DataFrame({'stn':stn,'type':'outflow','year':steps.year,'month':steps.month,'day':steps.day,
+                                    'hour':steps.hour,'minute':steps.minute,'ex_year':expiry.year,'ex_month':expiry.month,
+                                    'ex_day':expiry.day,'ex_hour':expiry.hour,'ex_minute':expiry.minute,
+                                    'flow_cusecs':np.round(rng.lognormal(7,1,len(steps)),3)}))
+    pd.concat(frames,ignore_index=True).to_csv(path,header=False,index=False)
+
+def write_sc(rng,scale,work_dir,folder):
+    contributors = ['P%d' % (i+1) for i in range(scale['sc_targets']*2)]
+    with open(work_dir+'sc_metadata.csv','w') as sc_file:
+        writer = csv.writer(sc_file,lineterminator='\n')
+        for t in range(scale['sc_targets']):
+            for contributor in rng.choice(contributors,scale['sc_contributors'],replace=False):
+                writer.writerow(['T%d' % (t+1),contributor,'remove' if rng.random() < 0.15 else 'add'])
+    start,forecast,end = task_dates(scale)
+    write_flow_output(rng,contributors,start,end,work_dir+'sc_input/'+folder)
+
+def write_hms_output(rng,scale,model_dir,work_dir):
+    # stand-in forecast output dss read by dssoutput.py, one 30 minute flow record per inflow and outflow point
+    start,forecast,end = task_dates(scale)
+    first = datetime.datetime.combine(start,datetime.time())
+    n_values = scale['days']*48
+    times = np.arange(n_values)*30+int((first-HEC_EPOCH).total_seconds()//60)+30
+    records = {}
+    for kind in ['inflow','outflow']:
+        with open(work_dir+kind+'s_metadata.csv','w') as metadata_file:
+            writer = csv.writer(metadata_file,lineterminator='\n')
+            writer.writerow(['name','point'])
+            for stn in station_ids(scale):
+                point = kind[0].upper()+stn
+                writer.writerow([stn,point])
+                records['/GODAVARI/%s/FLOW/01JUN2023/30MIN/FOR:%s/' % (point,DSS_NAME)] = {'times':times,'values':rng.lognormal(3,1,n_values)}
+    for i in range(scale['sc_targets']*2):    # self catchment points of sc_metadata.csv
+        records['/GODAVARI/P%d/FLOW/01JUN2023/30MIN/FOR:%s/' % (i+1,DSS_NAME)] = {'times':times,'values':rng.lognormal(3,1,n_values)}
+    dss_stand_in.save_records(model_dir+DSS_NAME+'.dss',records)
+
+def write_constants(constants_dict,path):
+    with open(path,'w') as constants_file:
+        writer = csv.writer(constants_file,lineterminator='\n')
+        for key,value in constants_dict.items():
+            writer.writerow([key,value])
+
+def build(work_dir,scale_name,seed=0):
+    scale = SCALES[scale_name]
+    rng = np.random.default_rng(seed)
+    work_dir = work_dir.rstrip('/')+'/'
+    folder = folder_name(scale)
+    dirs = {'INPUT_GRID_DIR':'input_grid/','OBS_FLOWS_DIR':'obs_flows/','MODEL_INP_PATH':'model_inp/','OBS_DSS_DIR':'obs_dss/',
+            'NC_FILE_PATH':'nc/','DSS_FILE_PATH':'dss/','CACHE_DIR':'cache/','MODEL_PATH':'model/','OUTPUT_DIR':'fc_output/',
+            'SC_INPUT_CSV_PATH':'sc_input/','SC_OUTPUT_FILE_PATH':'sc_output/'}
+    constants_dict = {}
+    for key,name in dirs.items():
+        constants_dict[key] = work_dir+name
+        os.makedirs(work_dir+name,exist_ok=True)
+    os.makedirs(work_dir+'input_grid/'+folder+'/',exist_ok=True)
+    for stn in station_ids(scale):
+        os.makedirs(work_dir+'model_inp/'+stn,exist_ok=True)
+
+    cells = write_grid_days(rng,scale,work_dir+'input_grid/'+folder+'/')
+    write_observed(rng,scale,work_dir+'obs_flows/observed_data_'+folder)
+    pd.DataFrame({'stn':station_ids(scale)}).to_excel(work_dir+'stations.xlsx',index=False)
+    with open(work_dir+'obs_metadata.csv','w') as obs_metadata:
+        writer = csv.writer(obs_metadata,lineterminator='\n')
+        writer.writerow(['node','Gage_name','lat','lon','file'])
+        for i,stn in enumerate(station_ids(scale)):
+            writer.writerow([stn,'G%d' % (i+1),0,0,'realtime_inflows_input'])
+    with open(work_dir+'metadata.csv','w') as metadata_file:
+        metadata_file.write(folder+','+DSS_NAME+',IMD\n')
+    write_hms_templates(rng,scale,work_dir+'model/')
+    write_sc(rng,scale,work_dir,folder)
+    write_hms_output(rng,scale,work_dir+'model/',work_dir)
+
+    constants_dict.update({'STATIONS_DATA':work_dir+'stations.xlsx','OBS_DSS_FILE_PATH':work_dir+'obs_metadata.csv',
+                           'METADATA_INPUT_FILE':work_dir+'metadata.csv','SC_METADATA_PATH':work_dir+'sc_metadata.csv',
+                           'FORECAST_FILE_PATH':work_dir+'model/forecast/','GRID_FILE_PATH':work_dir+'model/Godavari.grid',
+                           'GAGE_FILE_PATH':work_dir+'model/Godavari.gage','BASIN_FILE_PATH':work_dir+'model/Godavari.basin',
+                           'CN_GODAVARI':work_dir+'model/cn_godavari.csv','INFLOWS_METADATA_CSV':work_dir+'inflows_metadata.csv',
+                           'OUTFLOWS_METADATA_CSV':work_dir+'outflows_metadata.csv','HMS_CONSTANTS_FILE':work_dir+'constants.csv'})
+    write_constants(constants_dict,constants_dict['HMS_CONSTANTS_FILE'])
+    start,forecast,end = task_dates(scale)
+    return constants_dict,{'folder':folder,'start':start,'forecast':forecast,'end':end,'grid_cells':cells,'scale':scale}
@@ -0,0 +1,194 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import runpy
+import argparse
+import platform
+import tempfile
+import datetime
+import statistics
+import subprocess
+import contextlib
+import importlib.util
+
+# times the pipeline stages on synthetic fixtures (fixtures.py) with the dss stand-in (dss_stand_in.py)
+#   python benchmarks/run_benchmarks.py --scale godavari --repeat 5 --label before
+#   python benchmarks/run_benchmarks.py --compare benchmarks/results/before.json benchmarks/results/after.json
+# results go to benchmarks/results/<label>.json with the git commit, scale, seed and library versions,
+# so a comparison is only made between runs on the same inputs
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SCRIPTS_DIR = os.path.join(REPO_DIR,'HECHMS_scripts')
+RESULTS_DIR = os.path.join(BENCH_DIR,'results')
+sys.path.insert(0,SCRIPTS_DIR)
+
+import dss_stand_in
+dss_stand_in.install()
+import fixtures
+import numpy as np
+import pandas as pd
+import hms_files
+import hechms_godavari
+
+def stage_benchmarks(constants_dict,info):
+    # (name, callable) in run order, observed_flows_data_prep reads the files realtime_data_parse writes
+    folder = info['folder']
+    req_dates = folder.split('_')
+    grid_dir = constants_dict['INPUT_GRID_DIR']+folder+'/'
+    forecast_name = fixtures.DSS_NAME+'.forecast'
+
+    def nc_file_prepare():
+        hechms_godavari.nc_file_prepare(dict(constants_dict,NC_STREAMING='false'),req_dates[0],req_dates[2],grid_dir,folder)
+
+    def nc_file_prepare_streaming():
+        hechms_godavari.nc_file_prepare(dict(constants_dict,NC_STREAMING='true'),req_dates[0],req_dates[2],grid_dir,folder)
+
+    def nc_file_prepare_store():
+        # repeats after the first only hash the daily files and slice the store
+        hechms_godavari.nc_file_prepare(dict(constants_dict,RAINFALL_STORE='true'),req_dates[0],req_dates[2],grid_dir,folder,'BENCHMARK')
+
+    def rainfall_dss_prepare():
+        hechms_godavari.rainfall_dss_prepare(constants_dict,req_dates[0],req_dates[2],grid_dir,folder,fixtures.DSS_NAME)
+
+    def realtime_data_parse():
+        hechms_godavari.realtime_data_parse(constants_dict,hechms_godavari.OBSERVED_DATA+'_'+folder)
+
+    def observed_flows_data_prep():
+        hechms_godavari.observed_flows_data_prep(constants_dict)
+
+    def sc_merge():
+        hechms_godavari.sc_topology_cache.clear()
+        hechms_godavari.sc_merge(constants_dict,folder)
+
+    def forecast_file():
+        hms_files.parsed_files.clear()
+        hechms_godavari.forecast_file(constants_dict,forecast_name,info['start'],info['forecast'],info['end'])
+
+    def grid_file():
+        hms_files.parsed_files.clear()
+        hechms_godavari.grid_file(constants_dict,info['start'],info['end'])
+
+    def gage_file():
+        hms_files.parsed_files.clear()
+        hechms_godavari.gage_file(constants_dict,info['start'],info['forecast'],info['end'])
+
+    def basin_file():
+        hms_files.parsed_files.clear()
+        hechms_godavari.basin_file(constants_dict,None,constants_dict['BASIN_FILE_PATH'])
+
+    def dssoutput():
+        os.environ['HMS_CONSTANTS_FILE'] = constants_dict['HMS_CONSTANTS_FILE']
+        runpy.run_path(os.path.join(SCRIPTS_DIR,'dssoutput.py'),run_name='__main__')
+
+    benchmarks = [nc_file_prepare,nc_file_prepare_streaming,nc_file_prepare_store]
+    if importlib.util.find_spec('pyproj') is not None and importlib.util.find_spec('affine') is not None:
+        benchmarks.append(rainfall_dss_prepare)
+    else:
+        print('pyproj/affine not installed, skipping rainfall_dss_prepare')
+    def extract_forecast_outputs():
+        # in process replacement for dssoutput plus the self catchment extraction, compare with dssoutput + sc_merge
+        hechms_godavari.sc_topology_cache.clear()
+        hechms_godavari.extract_forecast_outputs(constants_dict,folder,fixtures.DSS_NAME,info['start'],info['end'])
+
+    benchmarks += [realtime_data_parse,observed_flows_data_prep,sc_merge,forecast_file,grid_file,gage_file,basin_file,dssoutput,extract_forecast_outputs]
+    return [(benchmark.__name__,benchmark) for benchmark in benchmarks]
+
+def time_benchmark(benchmark,repeat,warmup):
+    # stage output (prints) is swallowed so it does not end up in the timings
+    runs = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(warmup+repeat):
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            benchmark()
+            if i >= warmup:
+                runs.append({'wall_s':time.perf_counter()-wall_start,'cpu_s':time.process_time()-cpu_start})
+    walls = [run['wall_s'] for run in runs]
+    return {'runs':runs,'median_s':statistics.median(walls),'min_s':min(walls),'mean_s':statistics.mean(walls),
+            'cpu_median_s':statistics.median(run['cpu_s'] for run in runs)}
+
+def git_revision():
+    try:
+        commit = subprocess.check_output(['git','rev-parse','HEAD'],cwd=REPO_DIR,universal_newlines=True).strip()
+        dirty = subprocess.call(['git','diff','--quiet','HEAD','--','HECHMS_scripts'],cwd=REPO_DIR) != 0
+        return commit+('-dirty' if dirty else '')
+    except (OSError,subprocess.CalledProcessError):
+        return 'unknown'
+
+def environment():
+    versions = {'python':platform.python_version(),'numpy':np.__version__,'pandas':pd.__version__}
+    for name in ['scipy','xarray','netCDF4','pyarrow','pyproj']:
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            pass
+    return {'platform':platform.platform(),'cpu_count':os.cpu_count(),'versions':versions}
+
+def run(args):
+    work_dir = args.workdir or tempfile.mkdtemp(prefix='hechms_bench_')
+    try:
+        fixture_start = time.perf_counter()
+        constants_dict,info = fixtures.build(work_dir,args.scale,args.seed)
+        print('fixtures (%s, seed %d, %d grid cells, %d days) built in %.1fs under %s'
+              % (args.scale,args.seed,info['grid_cells'],info['scale']['days'],time.perf_counter()-fixture_start,work_dir))
+
+        only = set(args.only.split(',')) if args.only else None
+        results = {}
+        for name,benchmark in stage_benchmarks(constants_dict,info):
+            if only is not None and name not in only:
+                continue
+            results[name] = time_benchmark(benchmark,args.repeat,args.warmup)
+            print('%-28s median %9.4fs  min %9.4fs  cpu %9.4fs' % (name,results[name]['median_s'],results[name]['min_s'],results[name]['cpu_median_s']))
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(work_dir,ignore_errors=True)
+
+    label = args.label or datetime.datetime.now().strftime('%Y%m%d_%H%M%S')+'_'+args.scale
+    os.makedirs(RESULTS_DIR,exist_ok=True)
+    result_path = os.path.join(RESULTS_DIR,label+'.json')
+    with open(result_path,'w') as result_file:
+        json.dump({'label':label,'created':datetime.datetime.now().isoformat(),'git':git_revision(),'scale':args.scale,
+                   'scale_parameters':fixtures.SCALES[args.scale],'seed':args.seed,'repeat':args.repeat,'warmup':args.warmup,
+                   'environment':environment(),'results':results},result_file,indent=1)
+    print('results written to '+result_path)
+
+def compare(base_path,new_path):
+    with open(base_path) as base_file:
+        base = json.load(base_file)
+    with open(new_path) as new_file:
+        new = json.load(new_file)
+    if (base['scale'],base['seed']) != (new['scale'],new['seed']):
+        print('warning: different inputs, %s seed %d against %s seed %d' % (base['scale'],base['seed'],new['scale'],new['seed']))
+    if base['environment'] != new['environment']:
+        print('warning: results come from different machines or library versions')
+    print('%-28s %12s %12s %9s' % ('stage',base['label'],new['label'],'change'))
+    for name in base['results']:
+        if name not in new['results']:
+            continue
+        before = base['results'][name]['median_s']
+        after = new['results'][name]['median_s']
+        print('%-28s %11.4fs %11.4fs %+8.1f%%' % (name,before,after,(after-before)/before*100))
+
+def main():
+    parser = argparse.ArgumentParser(description='time the hec-hms pipeline stages on synthetic inputs')
+    parser.add_argument('--scale',choices=sorted(fixtures.SCALES),default='godavari')
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--repeat',type=int,default=5)
+    parser.add_argument('--warmup',type=int,default=1)
+    parser.add_argument('--only',help='comma separated stage names')
+    parser.add_argument('--label',help='result file name, default is the time and scale')
+    parser.add_argument('--workdir',help='build the fixtures here and keep them, default is a temporary folder')
+    parser.add_argument('--keep',action='store_true',help='keep the temporary fixture folder')
+    parser.add_argument('--compare',nargs=2,metavar=('BASE','NEW'),help='compare two result files')
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
+
+if __name__ == '__main__':
+    main()